@@ -0,0 +1,145 @@
+from hashlib import sha256
+from urllib.parse import urlencode, urlsplit
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Tags
+
+VERSION_KEY = "version:{name}"
+CATALOG_KEY = "catalog:{name}:{version}:{path}?{params}"
+PAGE_LINKS = ("next", "previous")
+TAGS_VERSION = "tags"
+RECIPES_VERSION = "recipes"
+RECIPE_FRAGMENT_KEY = "recipe:{version}:{id}"
+TAG_IDS_KEY = "tag-ids:{version}"
+SHOPPING_LIST_VERSION = "shopping-list:{user_id}"
+SHOPPING_LISTS_VERSION = "shopping-lists"
+SHOPPING_LIST_KEY = "shopping-list:{signature}"
+
+
+def get_version(name):
+    """
+    Получение текущей метки версии набора данных (например, 'ingredients').
+    Метка хранится в кэше без ограничения времени жизни и создается при
+    первом обращении.
+    """
+    return cache.get_or_set(VERSION_KEY.format(name=name), uuid4().hex, None)
+
+
+def bump_version(name):
+    """
+    Смена метки версии набора данных. Все процессы, сверяющие метку через
+    общий кэш, перестраивают зависящие от нее данные при следующем обращении.
+    """
+    cache.set(VERSION_KEY.format(name=name), uuid4().hex, None)
+
+
+def bump_shopping_list_versions(user_ids):
+    """
+    Смена меток версий списков покупок пользователей после фиксации текущей
+    транзакции (при изменении корзины или ингредиентов рецептов в корзине).
+    """
+    keys = [
+        VERSION_KEY.format(name=SHOPPING_LIST_VERSION.format(user_id=user_id))
+        for user_id in user_ids
+    ]
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many(
+                {key: uuid4().hex for key in keys}, timeout=None
+            )
+        )
+
+
+def get_tag_ids():
+    """
+    Словарь соответствия slug тегов их идентификаторам. Словарь хранится
+    в кэше и перестраивается при смене метки версии тегов.
+    """
+    key = TAG_IDS_KEY.format(version=get_version(TAGS_VERSION))
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tags.objects.values_list("slug", "id"))
+        cache.set(key, tag_ids, None)
+    return tag_ids
+
+
+def recipe_fragment_keys(recipe_ids):
+    """Ключи кэша отображений рецептов для текущей метки версии рецептов."""
+    version = get_version(RECIPES_VERSION)
+    return {
+        recipe_id: RECIPE_FRAGMENT_KEY.format(version=version, id=recipe_id)
+        for recipe_id in recipe_ids
+    }
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """
+    Удаление закэшированных отображений рецептов после фиксации текущей
+    транзакции (чтобы параллельный запрос не закэшировал старые данные).
+    """
+    keys = list(recipe_fragment_keys(recipe_ids).values())
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CatalogCacheMixin:
+    """
+    Кэширование справочных данных (теги, ингредиенты). Ответ на запрос списка
+    объектов хранится в кэше CATALOG_CACHE_TTL секунд вместе со строгим ETag
+    и перестраивается при смене метки версии 'catalog_version'. Ключ кэша
+    составляется из метки версии, пути и значений параметров 'catalog_params'
+    (параметры паджинации); запросы с другими параметрами не кэшируются.
+    Ссылки паджинации хранятся относительными и дополняются адресом сервера
+    из текущего запроса, поэтому заголовок Host не входит в ключ кэша.
+    При совпадении заголовка If-None-Match с ETag возвращается ответ 304.
+    """
+
+    catalog_version = None
+    catalog_params = ()
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if (
+            set(params) - set(self.catalog_params)
+            or request.accepted_renderer.format != "json"
+        ):
+            return super().list(request, *args, **kwargs)
+        key = CATALOG_KEY.format(
+            name=self.catalog_version,
+            version=get_version(self.catalog_version),
+            path=request.path,
+            params=urlencode(sorted(params.items())),
+        )
+        cached = cache.get(key)
+        if cached is None:
+            data = super().list(request, *args, **kwargs).data
+            for link in PAGE_LINKS if isinstance(data, dict) else ():
+                if data.get(link):
+                    data[link] = urlsplit(data[link])._replace(
+                        scheme="", netloc=""
+                    ).geturl()
+            etag = f'"{sha256(JSONRenderer().render(data)).hexdigest()}"'
+            cached = (etag, data)
+            cache.set(key, cached, settings.CATALOG_CACHE_TTL)
+        etag, data = cached
+        if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = HttpResponseNotModified()
+        else:
+            if isinstance(data, dict):
+                data = {
+                    field: request.build_absolute_uri(value)
+                    if field in PAGE_LINKS and value
+                    else value
+                    for field, value in data.items()
+                }
+            response = HttpResponse(
+                JSONRenderer().render(data), content_type="application/json"
+            )
+        response["ETag"] = etag
+        return response
@@ -1,8 +1,90 @@
+import json
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    Exists,
+    IntegerField,
+    OuterRef,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.expressions import RawSQL
+from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import FilterSet, filters
 
 from recipes.models import Recipes
 from users.models import CustomUser
 
+from .cache import get_tag_ids
+from .search import get_recipe_ingredient_index
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Фильтр по списку чисел, перечисленных через запятую."""
+
+
+def recipe_values(values):
+    """
+    Выражения для выборки рецептов по словарю {идентификатор рецепта:
+    значение}, переданному в запрос одним параметром JSON (без отдельного
+    параметра для каждого идентификатора): подзапрос идентификаторов рецептов
+    и значение для текущего рецепта.
+    """
+    data = json.dumps(values)
+    column = f'"{Recipes._meta.db_table}"."id"'
+    if connection.vendor == "postgresql":
+        ids = "SELECT key::integer FROM jsonb_each_text(%s::jsonb)"
+        value = f"(%s::jsonb ->> {column}::text)::integer"
+    else:
+        ids = "SELECT CAST(key AS INTEGER) FROM json_each(%s)"
+        value = f"""json_extract(%s, '$."' || {column} || '"')"""
+    return (
+        RawSQL(ids, [data]),
+        RawSQL(value, [data], output_field=IntegerField()),
+    )
+
+
+class RecipeOrderingFilter(filters.OrderingFilter):
+    """
+    Сортировка рецептов по дате публикации, времени приготовления,
+    популярности (счетчику добавлений в избранное 'favorites_count') или
+    рейтингу популярности ('popularity_score', рассчитывается командой
+    popularity). Для одинаковых значений рецепты дополнительно сортируются
+    по идентификатору в том же направлении, что соответствует составным
+    индексам модели рецептов.
+    """
+
+    descending_fields = ("popularity_score",)
+
+    def get_ordering_value(self, param):
+        """
+        Поля из 'descending_fields' по умолчанию сортируются по убыванию
+        (с префиксом '-' - по возрастанию).
+        """
+        value = super().get_ordering_value(param)
+        if value.lstrip("-") in self.descending_fields:
+            return value[1:] if value.startswith("-") else f"-{value}"
+        return value
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        tiebreaker = "-id" if ordering[-1].startswith("-") else "id"
+        return qs.order_by(*ordering, tiebreaker)
+
+
+def tag_choices():
+    """Варианты значений фильтра тегов из закэшированного словаря тегов."""
+    return [(slug, slug) for slug in get_tag_ids()]
+
 
 class RecipeFilter(FilterSet):
     """
@@ -10,18 +92,165 @@ class RecipeFilter(FilterSet):
     объекты модели Recipe:
 
     - tags: фильтр ищет объекты рецептов, у которых значение поля "slug"
-    совпадает с указанными значениями.
+    совпадает с указанными значениями. Варианты значений и идентификаторы
+    тегов берутся из кэша, а условие проверяется подзапросом EXISTS, поэтому
+    рецепты с несколькими подходящими тегами не дублируются.
     - author: фильтр позволяет выбрать объекты рецептов, у которых поле
     "author" (автор) совпадает с выбранным значением.
+    - search: полнотекстовый поиск по названию и описанию рецепта.
+    - has_ingredients: рецепты, которые можно приготовить из указанных
+    ингредиентов (с долей покрытия от 0 до 1 не меньше 'coverage', по
+    умолчанию 1), упорядоченные по убыванию доли покрытия.
+    - exclude_ingredients: рецепты без указанных ингредиентов.
+    - cooking_time_min / cooking_time_max: диапазон времени приготовления.
+    - ordering: сортировка по полям pub_date, cooking_time, popularity
+    (с префиксом '-' - по убыванию) и popular (рейтинг популярности, сначала
+    популярные).
     """
 
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices, method="filter_tags"
+    )
     author = filters.ModelChoiceFilter(queryset=CustomUser.objects.all())
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
+    search = filters.CharFilter(method="filter_search")
+    has_ingredients = NumberInFilter(
+        method="filter_has_ingredients", min_value=1
+    )
+    exclude_ingredients = NumberInFilter(
+        method="filter_exclude_ingredients", min_value=1
+    )
+    coverage = filters.NumberFilter(
+        method="filter_coverage", min_value=0, max_value=1
+    )
+    cooking_time_min = filters.NumberFilter(
+        field_name="cooking_time", lookup_expr="gte"
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name="cooking_time", lookup_expr="lte"
+    )
+    ordering = RecipeOrderingFilter(
+        fields=(
+            ("pub_date", "pub_date"),
+            ("cooking_time", "cooking_time"),
+            ("favorites_count", "popularity"),
+            ("popularity_score", "popular"),
+        )
+    )
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Фильтр возвращает объекты рецептов, у которых есть хотя бы один
+        из указанных тегов. Словарь тегов мог смениться после проверки
+        значений (тег удален), такие slug пропускаются.
+        """
+        if not value:
+            return queryset
+        tag_ids = get_tag_ids()
+        tag_ids = [tag_ids[slug] for slug in value if slug in tag_ids]
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(
+            Exists(
+                Recipes.tags.through.objects.filter(
+                    recipes_id=OuterRef("pk"), tags_id__in=tag_ids
+                )
+            )
+        )
+
+    def filter_search(self, queryset, name, value):
+        """
+        Фильтр возвращает объекты рецептов, соответствующие поисковому
+        запросу, в порядке убывания релевантности.
+        В PostgreSQL используется хранимый столбец tsvector 'search_vector'
+        с русской конфигурацией полнотекстового поиска (GIN индекс) и
+        ранжирование ts_rank. Для других СУБД выполняется поиск по вхождению
+        подстроки; совпадения в названии ранжируются выше совпадений
+        в описании.
+        """
+        if not value:
+            return queryset
+        if connection.vendor == "postgresql":
+            query = SearchQuery(
+                value, config="russian", search_type="websearch"
+            )
+            vector = RawSQL(
+                f'"{Recipes._meta.db_table}"."search_vector"',
+                [],
+                output_field=SearchVectorField(),
+            )
+            return (
+                queryset.alias(search_vector=vector)
+                .filter(search_vector=query)
+                .annotate(search_rank=SearchRank(vector, query))
+                .order_by("-search_rank", "-id")
+            )
+        return (
+            queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+            .annotate(
+                search_rank=Case(
+                    When(name__icontains=value, then=Value(1)),
+                    default=Value(0),
+                )
+            )
+            .order_by("-search_rank", "-id")
+        )
+
+    def filter_has_ingredients(self, queryset, name, value):
+        """
+        Фильтр возвращает объекты рецептов, ингредиенты которых покрываются
+        указанным набором. Доли покрытия вычисляются по индексу состава
+        рецептов и округляются до процента для сортировки; рецепты и их доли
+        передаются в запрос одним параметром JSON.
+        """
+        if not value:
+            return queryset
+        exclude_ids = self.form.cleaned_data["exclude_ingredients"] or ()
+        min_coverage = self.form.cleaned_data["coverage"]
+        coverage = get_recipe_ingredient_index().coverage(
+            list(map(int, value)),
+            list(map(int, exclude_ids)),
+            1 if min_coverage is None else float(min_coverage),
+        )
+        if not coverage:
+            return queryset.none()
+        recipe_ids, percent = recipe_values(
+            {
+                recipe_id: round(share * 100)
+                for recipe_id, share in coverage.items()
+            }
+        )
+        return (
+            queryset.filter(pk__in=recipe_ids)
+            .annotate(ingredient_coverage=percent)
+            .order_by("-ingredient_coverage", "-id")
+        )
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        """
+        Фильтр исключает объекты рецептов, содержащие указанные ингредиенты
+        (если задан has_ingredients, исключение выполняется в его фильтре).
+        """
+        if not value or self.form.cleaned_data.get("has_ingredients"):
+            return queryset
+        recipe_ids = get_recipe_ingredient_index().containing(
+            list(map(int, value))
+        )
+        if not recipe_ids:
+            return queryset
+        return queryset.exclude(
+            pk__in=recipe_values(dict.fromkeys(recipe_ids, 0))[0]
+        )
+
+    def filter_coverage(self, queryset, name, value):
+        """Доля покрытия используется фильтром has_ingredients."""
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         """
         Фильтр возвращает объекты рецептов, которые находятся в избранном
@@ -42,4 +271,16 @@ class RecipeFilter(FilterSet):
 
     class Meta:
         model = Recipes
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "tags",
+            "author",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "search",
+            "has_ingredients",
+            "exclude_ingredients",
+            "coverage",
+            "cooking_time_min",
+            "cooking_time_max",
+            "ordering",
+        )
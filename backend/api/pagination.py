@@ -1,5 +1,118 @@
+from functools import cached_property, partial
+from hashlib import sha256
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+COUNT_KEY = "count:{alias}:{signature}"
+CURSOR_ORDERING_MESSAGE = (
+    "Курсорная паджинация недоступна при сортировке, отличной от "
+    "сортировки по умолчанию (параметры ordering, search, has_ingredients)."
+)
+
+
+class ExactCount:
+    """Точный подсчет количества объектов набора запросов (COUNT(*))."""
+
+    def count(self, queryset):
+        """Возвращает пару (количество, признак точного значения)."""
+        return queryset.count(), True
+
+
+class ApproximateCount(ExactCount):
+    """
+    Приблизительный подсчет количества объектов набора запросов:
+    - для набора без фильтров - оценка по статистике таблицы PostgreSQL
+    (pg_class.reltuples);
+    - для набора с фильтрами (и для других СУБД) - закэшированное на
+    APPROXIMATE_COUNT_TTL секунд значение COUNT(*), ключ кэша - псевдоним
+    базы данных набора и хэш SQL условий выборки.
+    """
+
+    def count(self, queryset):
+        if queryset.query.is_empty():
+            return 0, True
+        if not queryset.query.where:
+            count = self.estimate_table_count(queryset)
+            if count is not None:
+                return count, False
+        sql, params = queryset.order_by().values("pk").query.sql_with_params()
+        key = COUNT_KEY.format(
+            alias=queryset.db,
+            signature=sha256(f"{sql}{params}".encode()).hexdigest()
+        )
+        count = cache.get(key)
+        if count is not None:
+            return count, False
+        count, exact = super().count(queryset)
+        cache.set(key, count, settings.APPROXIMATE_COUNT_TTL)
+        return count, exact
+
+    def estimate_table_count(self, queryset):
+        """
+        Оценка количества строк таблицы модели набора запросов в базе данных
+        набора. Для других СУБД и таблиц без собранной статистики
+        возвращается None.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
+
+
+class CountPaginator(Paginator):
+    """
+    Паджинатор, вычисляющий количество объектов с помощью 'counter'
+    (ExactCount или ApproximateCount).
+    """
+
+    def __init__(self, *args, counter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = counter or ExactCount()
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = self.counter.count(self.object_list)
+        return count
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Курсорная паджинация по убыванию идентификатора объектов (сортировка
+    моделей по умолчанию) с параметром 'limit' в запросе. Значение 'limit'
+    ограничено настройкой MAX_PAGE_SIZE.
+    """
+
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    page_size_query_param = "limit"
+    max_page_size = settings.MAX_PAGE_SIZE
+    ordering = "-id"
+
+    def get_page_window(self, request):
+        """
+        Позиция курсора запроса, направление выборки (по убыванию или
+        возрастанию поля сортировки) и количество объектов, которые читает
+        страница (со смещением курсора и объектом следующей страницы).
+        Позволяет ограничить подзапросы набора объектов до паджинации.
+        """
+        cursor = self.decode_cursor(request)
+        offset, reverse, position = cursor or (0, False, None)
+        descending = self.ordering.startswith("-") != reverse
+        return position, descending, offset + self.get_page_size(request) + 1
 
 
 class LimitPageNumberPagination(PageNumberPagination):
@@ -7,7 +120,48 @@ class LimitPageNumberPagination(PageNumberPagination):
     Добавляет параметр 'limit' в запрос эндпоинта с возможностью указания
     значения для паджинации. По умолчанию будет использован параметр паджинации
     из настроек ('settings') проекта.
+    Параметр 'pagination=cursor' (либо параметр 'cursor' из ссылок next /
+    previous) включает курсорную паджинацию: страницы выбираются по ключу
+    без COUNT(*) и OFFSET, в ответе отсутствует поле 'count'. Курсор строится
+    только по сортировке по умолчанию, поэтому для набора с другой
+    сортировкой курсорная паджинация отклоняется (400), а не отбрасывает
+    ее молча.
+    Параметр 'count=approximate' разрешает вместо точного COUNT(*) использовать
+    способ подсчета, заданный в представлении ('count_class'). Поле ответа
+    'count_exact' показывает, является ли значение 'count' точным.
     """
 
     page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
     page_size_query_param = "limit"
+    cursor_pagination_class = LimitCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_class = ExactCount
+        if request.query_params.get("count") == "approximate":
+            count_class = getattr(view, "count_class", ExactCount)
+        self.django_paginator_class = partial(
+            CountPaginator, counter=count_class()
+        )
+        if (
+            request.query_params.get("pagination") == "cursor"
+            or self.cursor_pagination_class.cursor_query_param
+            in request.query_params
+        ):
+            self.cursor_paginator = self.cursor_pagination_class()
+            ordering = tuple(queryset.query.order_by)
+            if ordering and ordering != (self.cursor_paginator.ordering,):
+                raise ValidationError(
+                    {"pagination": [CURSOR_ORDERING_MESSAGE]}
+                )
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        response.data["count_exact"] = self.page.paginator.count_exact
+        return response
@@ -0,0 +1,472 @@
+from bisect import bisect_left
+from functools import lru_cache
+from random import randrange
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Ingredients, IngredientsInRecipe
+
+from .cache import get_version
+
+INGREDIENTS_VERSION = "ingredients"
+RECIPE_INGREDIENTS_VERSION = "recipe-ingredients"
+RECIPE_CHANGES_KEY = "recipe-ingredient-changes:{version}"
+RECIPE_CHANGE_KEY = "recipe-ingredient-change:{version}:{number}"
+RECIPE_CHANGE_TTL = 60 * 60 * 24
+RECIPE_CHANGES_MAX_LAG = 1000
+RECIPE_CHANGES_START = 2**62
+NGRAM_SIZE = 2
+FUZZY_DEPTH = 24
+FUZZY_CACHE_SIZE = 1024
+
+index_lock = Lock()
+current_indexes = {}
+
+
+def ngrams(value, size=NGRAM_SIZE):
+    """Множество n-грамм строки заданной длины."""
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+def word_starts(name):
+    """Окончания названия, начинающиеся с каждого его слова."""
+    return [
+        name[index:]
+        for index in range(len(name))
+        if index == 0 or name[index - 1] == " "
+    ]
+
+
+def count_at_least(masks, count):
+    """
+    Битовая маска элементов, входящих не менее чем в 'count' масок из
+    'masks' (levels[n] - маска элементов, встреченных не менее n раз).
+    """
+    levels = [-1] + [0] * count
+    for mask in masks:
+        for level in range(count, 0, -1):
+            levels[level] |= levels[level - 1] & mask
+    return levels[count]
+
+
+def bit_positions(mask):
+    """Номера установленных битов маски по возрастанию."""
+    bits = bin(mask)[:1:-1]
+    position = bits.find("1")
+    while position != -1:
+        yield position
+        position = bits.find("1", position + 1)
+
+
+class IngredientSearchIndex:
+    """
+    Процессный индекс для поиска ингредиентов по названию без обращения
+    к базе данных:
+
+    - prefixes: отсортированный список пар (название, позиция) для поиска
+    совпадений по началу названия бинарным поиском;
+    - postings: словарь n-грамм и множеств позиций ингредиентов, содержащих
+    эту n-грамму, для поиска совпадений по вхождению подстроки;
+    - ingredients_by_id: словарь ингредиентов по идентификатору для проверки
+    идентификаторов в данных рецептов;
+    - word_starts: отсортированный список начал слов названий (окончание
+    названия с начала слова, не длиннее FUZZY_DEPTH символов, номер слова,
+    позиция ингредиента) для нечеткого поиска. Номер начала слова в списке -
+    номер его бита в масках gram_masks;
+    - gram_masks: словарь пар (n-грамма длины 1 или NGRAM_SIZE, смещение
+    в начале слова) и битовых масок начал слов с этой n-граммой на этом
+    смещении для отбора кандидатов нечеткого поиска;
+    - trie: префиксное дерево начал слов. Узел дерева - словарь {символ:
+    (дочерний узел, первый номер, следующий за последним номер)}, начала
+    слов ниже узла занимают непрерывный диапазон номеров в word_starts.
+
+    Позиции ингредиентов соответствуют порядку сортировки модели по умолчанию.
+    После построения индекс не изменяется, поэтому результаты нечеткого
+    поиска по повторяющимся запросам кэшируются на время жизни индекса.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.ingredients = list(Ingredients.objects.all())
+        self.ingredients_by_id = {
+            ingredient.id: ingredient for ingredient in self.ingredients
+        }
+        self.names = [
+            ingredient.name.lower() for ingredient in self.ingredients
+        ]
+        self.prefixes = sorted(
+            (name, position) for position, name in enumerate(self.names)
+        )
+        self.postings = {}
+        for position, name in enumerate(self.names):
+            for gram in ngrams(name):
+                self.postings.setdefault(gram, set()).add(position)
+        self.word_starts = sorted(
+            (start[:FUZZY_DEPTH], word, position)
+            for position, name in enumerate(self.names)
+            for word, start in enumerate(word_starts(name))
+        )
+        self.gram_masks = {}
+        for number, (start, _, _) in enumerate(self.word_starts):
+            for size in (1, NGRAM_SIZE):
+                for offset in range(len(start) - size + 1):
+                    key = (start[offset:offset + size], offset)
+                    self.gram_masks[key] = self.gram_masks.get(key, 0) | (
+                        1 << number
+                    )
+        self.trie = self.build_trie(0, len(self.word_starts), 0)
+        self.fuzzy_search = lru_cache(maxsize=FUZZY_CACHE_SIZE)(
+            self.fuzzy_search
+        )
+
+    def startswith(self, name):
+        """Позиции ингредиентов, название которых начинается с 'name'."""
+        start = bisect_left(self.prefixes, (name,))
+        positions = []
+        for prefix, position in self.prefixes[start:]:
+            if not prefix.startswith(name):
+                break
+            positions.append(position)
+        return sorted(positions)
+
+    def contains(self, name):
+        """Позиции ингредиентов, название которых содержит 'name'."""
+        if len(name) < NGRAM_SIZE:
+            candidates = range(len(self.names))
+        else:
+            postings = sorted(
+                (self.postings.get(gram, set()) for gram in ngrams(name)),
+                key=len,
+            )
+            candidates = sorted(set.intersection(*postings))
+        return [
+            position for position in candidates if name in self.names[position]
+        ]
+
+    def search(self, name):
+        """
+        Поиск ингредиентов: сначала совпадения по началу названия, затем
+        совпадения по вхождению подстроки.
+        """
+        name = name.lower()
+        start_positions = self.startswith(name)
+        found = set(start_positions)
+        positions = start_positions + [
+            position
+            for position in self.contains(name)
+            if position not in found
+        ]
+        return [self.ingredients[position] for position in positions]
+
+    def build_trie(self, first, last, depth):
+        """
+        Узел префиксного дерева для начал слов с номерами от 'first' до
+        'last' (не включая), совпадающих в первых 'depth' символах.
+        """
+        children = {}
+        while first < last and len(self.word_starts[first][0]) == depth:
+            first += 1
+        while first < last:
+            char = self.word_starts[first][0][depth]
+            end = first + 1
+            while end < last and self.word_starts[end][0][depth] == char:
+                end += 1
+            child = self.build_trie(first, end, depth + 1)
+            children[char] = (child, first, end)
+            first = end
+        return children
+
+    def fuzzy_candidates(self, name, limit):
+        """
+        Битовая маска начал слов, которые могут совпасть с 'name' не более
+        чем с 'limit' опечатками. Опечатка затрагивает не более 'size'
+        n-грамм запроса длины 'size', а остальные n-граммы сдвигаются не
+        более чем на 'limit' позиций, поэтому у подходящего начала слова не
+        меньше len(name) - size + 1 - size * limit n-грамм запроса находятся
+        на своем смещении +-'limit'. Проверяются n-граммы длины 1 и
+        NGRAM_SIZE (если оценка для них положительна).
+        """
+        candidates = -1
+        for size in (1, NGRAM_SIZE):
+            count = len(name) - size + 1 - size * limit
+            if count <= 0:
+                continue
+            masks = []
+            for offset in range(len(name) - size + 1):
+                gram = name[offset:offset + size]
+                mask = 0
+                for shift in range(max(offset - limit, 0), offset + limit + 1):
+                    mask |= self.gram_masks.get((gram, shift), 0)
+                masks.append(mask)
+            candidates &= count_at_least(masks, count)
+        return candidates
+
+    def fuzzy_lookup(self, name, limit, candidates, matches):
+        """
+        Обход префиксного дерева по ветвям с кандидатами 'candidates' с
+        вычислением расстояния Левенштейна между запросом и началом слова
+        битово-параллельным алгоритмом Майерса (столбец матрицы расстояний -
+        пара масок положительных и отрицательных приращений). Ветви, в
+        которых расстояние уже не может опуститься до 'limit', не
+        просматриваются. Кандидаты узла, на котором расстояние уменьшилось
+        до d <= 'limit', добавляются в маску matches[d].
+        """
+        equal = {}
+        for row, char in enumerate(name):
+            equal[char] = equal.get(char, 0) | (1 << row)
+        rows = (1 << len(name)) - 1
+        last_row = 1 << (len(name) - 1)
+        max_depth = len(name) + limit
+        stack = [(self.trie, 0, rows, 0, len(name))]
+        while stack:
+            node, depth, positive, negative, distance = stack.pop()
+            for char, (child, first, last) in node.items():
+                found = candidates >> first & ((1 << (last - first)) - 1)
+                if not found:
+                    continue
+                eq = equal.get(char, 0)
+                vertical = eq | negative
+                horizontal = (((eq & positive) + positive) ^ positive) | eq
+                up = negative | ~(horizontal | positive)
+                down = positive & horizontal
+                child_distance = distance
+                if up & last_row:
+                    child_distance += 1
+                elif down & last_row:
+                    child_distance -= 1
+                    if child_distance <= limit:
+                        matches[child_distance] |= found << first
+                if (
+                    depth + 1 < max_depth
+                    and child_distance - (max_depth - depth - 1) <= limit
+                ):
+                    up = ((up << 1) | 1) & rows
+                    down = (down << 1) & rows
+                    stack.append(
+                        (
+                            child,
+                            depth + 1,
+                            down | ~(vertical | up) & rows,
+                            up & vertical,
+                            child_distance,
+                        )
+                    )
+
+    def fuzzy_search(self, variants):
+        """
+        Нечеткий поиск ингредиентов с допуском опечаток. Каждый вариант
+        запроса (например, запрос в исходной и в исправленной раскладке
+        клавиатуры) проверяется по префиксному дереву начал слов только для
+        кандидатов, отобранных по n-граммам. Результаты упорядочены по числу
+        опечаток и номеру совпавшего слова в названии.
+        """
+        matches = [0] * (settings.INGREDIENT_FUZZY_MAX_DISTANCE + 1)
+        for name in {variant.lower() for variant in variants if variant}:
+            limit = min(
+                settings.INGREDIENT_FUZZY_MAX_DISTANCE, len(name) // 3
+            )
+            name = name[:FUZZY_DEPTH]
+            candidates = self.fuzzy_candidates(name, limit)
+            if candidates:
+                self.fuzzy_lookup(name, limit, candidates, matches)
+        positions = []
+        found = set()
+        for mask in matches:
+            for _, position in sorted(
+                self.word_starts[number][1:] for number in bit_positions(mask)
+            ):
+                if position not in found:
+                    found.add(position)
+                    positions.append(position)
+        return [self.ingredients[position] for position in positions]
+
+
+class RecipeIngredientIndex:
+    """
+    Процессный индекс состава рецептов: для каждого рецепта хранится битовая
+    маска его ингредиентов. Номера битов - компактная нумерация ингредиентов
+    справочника (ингредиенты, добавленные после построения индекса, получают
+    следующие номера), идентификаторы вне справочника в запросах не
+    учитываются. Проверка вхождения набора ингредиентов и доля покрытия
+    рецепта набором вычисляются побитовыми операциями над масками без
+    запросов к базе данных.
+
+    Индекс обновляется по журналу изменений состава рецептов в общем кэше
+    (см. record_recipe_changes): перечитываются ингредиенты только
+    измененных рецептов.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.changes_key = RECIPE_CHANGES_KEY.format(version=version)
+        self.applied = get_changes_counter(self.changes_key)
+        self.bits = {
+            ingredient_id: bit
+            for bit, ingredient_id in enumerate(
+                Ingredients.objects.order_by("id").values_list(
+                    "id", flat=True
+                )
+            )
+        }
+        self.masks = self.read_masks(IngredientsInRecipe.objects.all())
+
+    def read_masks(self, queryset):
+        """Битовые маски рецептов из набора ингредиентов рецептов."""
+        masks = {}
+        rows = queryset.values_list("recipe_id", "ingredient_id")
+        for recipe_id, ingredient_id in rows.iterator():
+            bit = self.bits.setdefault(ingredient_id, len(self.bits))
+            masks[recipe_id] = masks.get(recipe_id, 0) | (1 << bit)
+        return masks
+
+    def refresh(self):
+        """
+        Применение изменений из журнала: маски измененных рецептов
+        перечитываются одним запросом. Изменения, записанные не полностью
+        (запись в журнал еще выполняется), применяются при следующем
+        обращении. Возвращает False, если журнал неполон (записи устарели),
+        счетчик журнала сброшен (значение меньше примененного либо
+        создано заново) или отставание слишком велико и индекс нужно
+        перестроить.
+        """
+        last = get_changes_counter(self.changes_key)
+        if last == self.applied:
+            return True
+        if not 0 < last - self.applied <= RECIPE_CHANGES_MAX_LAG:
+            return False
+        keys = [
+            RECIPE_CHANGE_KEY.format(version=self.version, number=number)
+            for number in range(self.applied + 1, last + 1)
+        ]
+        changes = cache.get_many(keys)
+        recipe_ids = set()
+        applied = self.applied
+        for key in keys:
+            if key not in changes:
+                break
+            recipe_ids.update(changes[key])
+            applied += 1
+        if len(changes) > applied - self.applied:
+            return False
+        masks = dict(self.masks)
+        for recipe_id in recipe_ids:
+            masks.pop(recipe_id, None)
+        masks.update(
+            self.read_masks(
+                IngredientsInRecipe.objects.filter(recipe_id__in=recipe_ids)
+            )
+        )
+        self.masks = masks
+        self.applied = applied
+        return True
+
+    def mask(self, ingredient_ids):
+        """Битовая маска набора ингредиентов."""
+        mask = 0
+        for ingredient_id in ingredient_ids:
+            bit = self.bits.get(ingredient_id)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def containing(self, ingredient_ids):
+        """Идентификаторы рецептов, содержащих любой из ингредиентов."""
+        mask = self.mask(ingredient_ids)
+        return [
+            recipe_id
+            for recipe_id, recipe_mask in self.masks.items()
+            if recipe_mask & mask
+        ]
+
+    def coverage(self, ingredient_ids, exclude_ids=(), min_coverage=1):
+        """
+        Доля ингредиентов рецепта, имеющихся в наборе 'ingredient_ids', для
+        рецептов, содержащих хотя бы один ингредиент набора, с долей не
+        меньше 'min_coverage' и без ингредиентов из 'exclude_ids'. Возвращает
+        словарь {идентификатор рецепта: доля}.
+        """
+        pantry = self.mask(ingredient_ids)
+        excluded = self.mask(exclude_ids)
+        coverage = {}
+        if not pantry:
+            return coverage
+        for recipe_id, recipe_mask in self.masks.items():
+            if recipe_mask & excluded:
+                continue
+            share = (
+                (recipe_mask & pantry).bit_count() / recipe_mask.bit_count()
+            )
+            if share and share >= min_coverage:
+                coverage[recipe_id] = share
+        return coverage
+
+
+def get_index(index_class, version_name):
+    """
+    Получение индекса 'index_class' текущего процесса. Индекс перестраивается,
+    если метка версии 'version_name' сменилась (см. сигналы приложения api).
+    """
+    version = get_version(version_name)
+    index = current_indexes.get(index_class)
+    if index is None or index.version != version:
+        with index_lock:
+            index = current_indexes.get(index_class)
+            if index is None or index.version != version:
+                index = current_indexes[index_class] = index_class(version)
+    return index
+
+
+def get_ingredient_index():
+    """Получение индекса поиска ингредиентов текущего процесса."""
+    return get_index(IngredientSearchIndex, INGREDIENTS_VERSION)
+
+
+def get_recipe_ingredient_index():
+    """
+    Получение индекса состава рецептов текущего процесса с применением
+    изменений из журнала (при неполном журнале индекс перестраивается).
+    """
+    index = get_index(RecipeIngredientIndex, RECIPE_INGREDIENTS_VERSION)
+    with index_lock:
+        index = current_indexes.get(RecipeIngredientIndex, index)
+        if not index.refresh():
+            index = current_indexes[RecipeIngredientIndex] = (
+                RecipeIngredientIndex(index.version)
+            )
+    return index
+
+
+def get_changes_counter(changes_key):
+    """
+    Значение счетчика журнала изменений. Отсутствующий счетчик (новый,
+    вытесненный из кэша или сброшенный) создается со случайным начальным
+    значением, поэтому индекс, построенный до сброса, не примет записи
+    нового счетчика за продолжение своего журнала.
+    """
+    cache.add(changes_key, randrange(RECIPE_CHANGES_START), None)
+    return cache.get(changes_key, 0)
+
+
+def record_recipe_changes(recipe_ids):
+    """
+    Запись рецептов с измененным составом в журнал изменений после фиксации
+    текущей транзакции. Номер записи выдается счетчиком в общем кэше, записи
+    хранятся RECIPE_CHANGE_TTL секунд.
+    """
+    recipe_ids = list(recipe_ids)
+
+    def record():
+        version = get_version(RECIPE_INGREDIENTS_VERSION)
+        changes_key = RECIPE_CHANGES_KEY.format(version=version)
+        cache.add(changes_key, randrange(RECIPE_CHANGES_START), None)
+        number = cache.incr(changes_key)
+        cache.set(
+            RECIPE_CHANGE_KEY.format(version=version, number=number),
+            recipe_ids,
+            RECIPE_CHANGE_TTL,
+        )
+
+    transaction.on_commit(record)
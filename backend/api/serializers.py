@@ -1,4 +1,7 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import IntegrityError
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from django.db.transaction import atomic
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import exceptions, relations, serializers, status
@@ -7,12 +10,62 @@ from recipes.models import (
     Favorites,
     Ingredients,
     IngredientsInRecipe,
+    IngredientsInShoppingList,
     Recipes,
+    RecipesInFeed,
     ShoppingCart,
     Tags,
 )
 from users.models import CustomUser, Follow
 
+from .cache import (
+    bump_shopping_list_versions,
+    invalidate_recipe_fragments,
+    recipe_fragment_keys,
+)
+from .search import get_ingredient_index, record_recipe_changes
+from .utils import change_counter
+
+
+def primary_keys(values):
+    """
+    Целочисленные идентификаторы из значений, переданных в данных запроса.
+    Некорректные значения пропускаются (ошибку для них формирует поле).
+    """
+    keys = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            keys.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return keys
+
+
+class ResolvedPrimaryKeyRelatedField(relations.PrimaryKeyRelatedField):
+    """
+    Поле идентификатора объекта, которое берет объект из словаря
+    'resolved_objects' корневого сериализатора (объекты всех идентификаторов
+    запроса, выбранные заранее одним запросом) вместо отдельного запроса
+    на каждое значение. Без словаря поле работает как PrimaryKeyRelatedField.
+    """
+
+    def to_internal_value(self, data):
+        resolved = getattr(self.root, "resolved_objects", {})
+        objects = resolved.get(self.get_queryset().model)
+        if objects is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail("does_not_exist", pk_value=data)
+        return objects[pk]
+
 
 class CustomUserSerializer(serializers.ModelSerializer):
     """
@@ -63,10 +116,27 @@ class IngredientsInRecipeReadSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
+class RecipesReadListSerializer(serializers.ListSerializer):
+    """
+    Сериализация списка рецептов с получением закэшированных отображений
+    всех рецептов страницы одним обращением к кэшу.
+    """
+
+    def to_representation(self, data):
+        return self.child.to_representation_many(
+            data.all() if isinstance(data, Manager) else data
+        )
+
+
 class RecipesReadSerializer(serializers.ModelSerializer):
     """
     Определение логики сериализации для чтения (отображения) объектов модели
     рецептов.
+    Общая для всех пользователей часть отображения рецепта (теги, автор,
+    ингредиенты, описание, путь к изображению) кэшируется по идентификатору
+    рецепта и метке версии рецептов. Признаки is_favorited,
+    is_in_shopping_cart и author.is_subscribed добавляются к отображению
+    при каждом запросе из аннотаций рецепта.
     """
 
     image = Base64ImageField()
@@ -94,6 +164,73 @@ class RecipesReadSerializer(serializers.ModelSerializer):
             "text",
             "cooking_time",
         )
+        list_serializer_class = RecipesReadListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many((instance,))[0]
+
+    def to_representation_many(self, instances):
+        """
+        Отображение рецептов: общие для всех пользователей части берутся из
+        кэша, затем к ним добавляются признаки текущего пользователя. Автор,
+        теги и ингредиенты загружаются (по запросу на связь) только для
+        рецептов, отсутствующих в кэше; их отображения кэшируются на
+        RECIPE_FRAGMENT_CACHE_TTL секунд.
+        """
+        keys = recipe_fragment_keys(instance.pk for instance in instances)
+        fragments = cache.get_many(keys.values())
+        missing = [
+            instance
+            for instance in instances
+            if keys[instance.pk] not in fragments
+        ]
+        if missing:
+            prefetch_related_objects(
+                missing,
+                "author",
+                "tags",
+                Prefetch(
+                    "ingredient_list",
+                    queryset=IngredientsInRecipe.objects.select_related(
+                        "ingredient"
+                    ),
+                ),
+            )
+            rendered = {
+                keys[instance.pk]: self.render_fragment(instance)
+                for instance in missing
+            }
+            cache.set_many(rendered, settings.RECIPE_FRAGMENT_CACHE_TTL)
+            fragments.update(rendered)
+        return [
+            self.add_user_flags(fragments[keys[instance.pk]], instance)
+            for instance in instances
+        ]
+
+    def render_fragment(self, instance):
+        """
+        Общая для всех пользователей часть отображения рецепта. Изображение
+        хранится в виде относительного пути.
+        """
+        fragment = super().to_representation(instance)
+        fragment["image"] = instance.image.url if instance.image else None
+        return fragment
+
+    def add_user_flags(self, fragment, instance):
+        """Добавление признаков текущего пользователя к отображению рецепта."""
+        request = self.context.get("request")
+        data = dict(fragment)
+        if data["image"] and request is not None:
+            data["image"] = request.build_absolute_uri(data["image"])
+        data["author"] = dict(
+            fragment["author"],
+            is_subscribed=getattr(instance, "author_is_subscribed", False),
+        )
+        data["is_favorited"] = getattr(instance, "is_favorited", False)
+        data["is_in_shopping_cart"] = getattr(
+            instance, "is_in_shopping_cart", False
+        )
+        return data
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -110,7 +247,7 @@ class IngredientsInRecipeWriteSerializer(serializers.ModelSerializer):
     в рецепте.
     """
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredients.objects.all())
+    id = ResolvedPrimaryKeyRelatedField(queryset=Ingredients.objects.all())
 
     class Meta:
         model = IngredientsInRecipe
@@ -125,7 +262,7 @@ class RecipesWriteSerializer(serializers.ModelSerializer):
     объектов этих моделей.
     """
 
-    tags = relations.PrimaryKeyRelatedField(
+    tags = ResolvedPrimaryKeyRelatedField(
         queryset=Tags.objects.all(), many=True
     )
     author = CustomUserSerializer(read_only=True)
@@ -146,22 +283,104 @@ class RecipesWriteSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("author",)
 
+    def resolve_objects(self, data):
+        """
+        Выбор тегов и ингредиентов по всем идентификаторам из данных запроса:
+        теги - одним запросом 'IN', ингредиенты - из процессного индекса
+        ингредиентов (INGREDIENT_SEARCH_IN_MEMORY = True) либо одним запросом
+        'IN'. Отсутствующие в индексе ингредиенты (например, добавленные после
+        его построения) запрашиваются из базы данных. Поля идентификаторов
+        берут объекты из полученных словарей.
+        """
+        tags = data.get("tags")
+        ingredients = data.get("ingredients")
+        tag_ids = primary_keys(tags if isinstance(tags, list) else ())
+        ingredient_ids = primary_keys(
+            item.get("id")
+            for item in (ingredients if isinstance(ingredients, list) else ())
+            if isinstance(item, dict)
+        )
+        found_ingredients = {}
+        if settings.INGREDIENT_SEARCH_IN_MEMORY and ingredient_ids:
+            index = get_ingredient_index().ingredients_by_id
+            found_ingredients = {
+                pk: index[pk] for pk in ingredient_ids if pk in index
+            }
+        missing_ids = ingredient_ids - found_ingredients.keys()
+        found_ingredients.update(Ingredients.objects.in_bulk(missing_ids))
+        return {
+            Tags: Tags.objects.in_bulk(tag_ids),
+            Ingredients: found_ingredients,
+        }
+
+    def to_internal_value(self, data):
+        if hasattr(data, "get"):
+            self.resolved_objects = self.resolve_objects(data)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.resolved_objects = {}
+
     @atomic
-    def create_bulk_ingredients(self, ingredients, recipe):
-        """Запись ингредиентов и их количества в рецепт."""
-        for ingredient in ingredients:
-            IngredientsInRecipe.objects.get_or_create(
-                recipe=recipe,
-                ingredient=ingredient["id"],
-                amount=ingredient["amount"],
+    def create_bulk_ingredients(self, ingredients, recipe, created=False):
+        """
+        Запись ингредиентов и их количества в рецепт по разнице между
+        сохраненными и переданными парами (ингредиент, количество): новые
+        записи создаются одним bulk_create, измененные - одним bulk_update,
+        лишние удаляются одним запросом (для нового рецепта ('created')
+        сохраненные записи не запрашиваются). Массовые операции не отправляют
+        сигналы модели, поэтому кэш отображения рецепта и индекс состава
+        рецептов сбрасываются явно.
+        Возвращает словари {ингредиент: количество} до и после изменения.
+        """
+        stored = {}
+        if not created:
+            stored = {
+                item.ingredient_id: item
+                for item in recipe.ingredient_list.all()
+            }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in stored.items()
+        }
+        new_amounts = {
+            ingredient["id"].id: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        new_items = [
+            IngredientsInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in stored
+        ]
+        changed_items = []
+        for ingredient_id, item in stored.items():
+            amount = new_amounts.get(ingredient_id, item.amount)
+            if amount != item.amount:
+                item.amount = amount
+                changed_items.append(item)
+        deleted_ids = [
+            item.pk
+            for ingredient_id, item in stored.items()
+            if ingredient_id not in new_amounts
+        ]
+        if not (new_items or changed_items or deleted_ids):
+            return old_amounts, new_amounts
+        IngredientsInRecipe.objects.bulk_create(new_items)
+        IngredientsInRecipe.objects.bulk_update(changed_items, ("amount",))
+        IngredientsInRecipe.objects.filter(pk__in=deleted_ids).delete()
+        invalidate_recipe_fragments((recipe.pk,))
+        record_recipe_changes((recipe.pk,))
+        return old_amounts, new_amounts
 
     @atomic
     def create(self, validated_data):
         """
         Переопределение метода записи рецепта с дополнительной проверкой
         на наличие уникальной записи (условие на уровне модели) и отображением
-        соответствующего текста ошибки.
+        соответствующего текста ошибки. Счетчик рецептов автора
+        увеличивается, рецепт записывается в ленты подписчиков автора.
         """
         try:
             ingredients_list = validated_data.pop("ingredients")
@@ -170,7 +389,11 @@ class RecipesWriteSerializer(serializers.ModelSerializer):
             recipe = Recipes.objects.create(author=author, **validated_data)
             recipe.save()
             recipe.tags.set(tags)
-            self.create_bulk_ingredients(ingredients_list, recipe)
+            self.create_bulk_ingredients(
+                ingredients_list, recipe, created=True
+            )
+            change_counter(CustomUser, author.id, "recipes_count", 1)
+            RecipesInFeed.objects.fan_out(recipe)
             return recipe
         except IntegrityError:
             error_message = (
@@ -180,13 +403,28 @@ class RecipesWriteSerializer(serializers.ModelSerializer):
 
     @atomic
     def update(self, instance, validated_data):
-        """Переопределение метода обновления записи рецепта."""
+        """
+        Переопределение метода обновления записи рецепта. Списки покупок
+        пользователей, добавивших рецепт в корзину, изменяются на разницу
+        в количестве ингредиентов, метки версий их выгрузок сменяются.
+        Рецепт блокируется до чтения сохраненных ингредиентов, поэтому
+        одновременное изменение корзин не применяет устаревший состав.
+        """
+        IngredientsInShoppingList.objects.lock_recipes(
+            (instance.pk,), for_change=True
+        )
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
-        instance.tags.clear()
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_bulk_ingredients(recipe=instance, ingredients=ingredients)
+        old_amounts, new_amounts = self.create_bulk_ingredients(
+            recipe=instance, ingredients=ingredients
+        )
+        if old_amounts != new_amounts:
+            bump_shopping_list_versions(
+                IngredientsInShoppingList.objects.change_recipe(
+                    instance.id, old_amounts, new_amounts
+                )
+            )
         return super().update(instance, validated_data)
 
     def validate_ingredients(self, data):
@@ -274,7 +512,7 @@ class FollowSerializer(CustomUserSerializer):
     """
 
     recipes_count = serializers.IntegerField(read_only=True)
-    recipes = RecipeShortRepresentationSerializer(many=True, read_only=True)
+    recipes = serializers.SerializerMethodField()
 
     class Meta(CustomUserSerializer.Meta):
         fields = CustomUserSerializer.Meta.fields + (
@@ -282,6 +520,20 @@ class FollowSerializer(CustomUserSerializer):
             "recipes_count",
         )
         read_only_fields = ("email", "username", "last_name", "first_name")
+        message = "Подписка на этого автора уже существует!"
+        self_message = "Нельзя подписывать на самого себя."
+
+    def get_recipes(self, author):
+        """
+        Рецепты автора: выбранные заранее для страницы подписок (с учетом
+        'recipes_limit') либо все рецепты автора.
+        """
+        recipes = getattr(author, "subscription_recipes", None)
+        if recipes is None:
+            recipes = author.recipes.all()
+        return RecipeShortRepresentationSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
     def validate(self, data):
         """
@@ -292,12 +544,12 @@ class FollowSerializer(CustomUserSerializer):
         user = self.context.get("request").user
         if Follow.objects.filter(user=user, author=author).exists():
             raise exceptions.ValidationError(
-                detail="Подписка на этого автора уже существует!",
+                detail=self.Meta.message,
                 code=status.HTTP_400_BAD_REQUEST,
             )
         if user == author:
             raise exceptions.ValidationError(
-                detail="Нельзя подписывать на самого себя.",
+                detail=self.Meta.self_message,
                 code=status.HTTP_400_BAD_REQUEST,
             )
         return data
@@ -306,20 +558,15 @@ class FollowSerializer(CustomUserSerializer):
 class BaseFavoritesAndShoppingWriteSerializer(serializers.ModelSerializer):
     """
     Базовый сериализатор для добавления рецептов в список избранного и корзину.
+    Наличие записи проверяется при вставке (см. serializer_add_delete), текст
+    ошибки для повторного добавления задается в Meta.message. Поля рецепта,
+    выбираемые при добавлении, - поля его сокращенного отображения.
     """
 
     class Meta:
         abstract = True
         fields = ("user", "recipe")
-
-    def validate(self, attrs):
-        user = attrs["user"]
-        recipe = attrs["recipe"]
-
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError({"errors": [self.Meta.message]})
-
-        return attrs
+        recipe_fields = RecipeShortRepresentationSerializer.Meta.fields
 
     def to_representation(self, instance):
         request = self.context.get("request")
@@ -348,3 +595,19 @@ class ShoppingCartWriteSerializer(BaseFavoritesAndShoppingWriteSerializer):
     class Meta(BaseFavoritesAndShoppingWriteSerializer.Meta):
         model = ShoppingCart
         message = "Рецепт уже добавлен в список покупок!"
+
+
+class BatchSerializer(serializers.Serializer):
+    """
+    Список идентификаторов объектов (рецептов или авторов) для пакетных
+    эндпоинтов: не более BATCH_MAX_SIZE идентификаторов, повторы удаляются.
+    """
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
@@ -0,0 +1,136 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from recipes.models import (
+    Favorites,
+    Ingredients,
+    IngredientsInRecipe,
+    IngredientsInShoppingList,
+    Recipes,
+    Tags,
+)
+from users.models import CustomUser, Follow
+
+from .cache import (
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    bump_shopping_list_versions,
+    bump_version,
+    invalidate_recipe_fragments,
+)
+from .search import INGREDIENTS_VERSION, record_recipe_changes
+from .utils import change_counters
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def ingredients_changed(sender, **kwargs):
+    """
+    Сброс индекса поиска ингредиентов и кэша отображений рецептов при
+    изменении списка ингредиентов.
+    """
+    bump_version(INGREDIENTS_VERSION)
+    bump_version(RECIPES_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Tags)
+def tags_changed(sender, **kwargs):
+    """
+    Сброс кэша справочника тегов и кэша отображений рецептов при изменении
+    списка тегов.
+    """
+    bump_version(TAGS_VERSION)
+    bump_version(RECIPES_VERSION)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_changed(sender, created, update_fields=None, **kwargs):
+    """
+    Сброс кэша отображений рецептов при изменении данных пользователя
+    (автора). Регистрация и обновление даты последнего входа не учитываются.
+    """
+    if created or (update_fields and set(update_fields) == {"last_login"}):
+        return
+    bump_version(RECIPES_VERSION)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    """
+    Уменьшение счетчиков подписчиков авторов, на которых подписан
+    пользователь, и счетчиков добавлений в избранное его избранных рецептов
+    до каскадного удаления его подписок и избранного.
+    """
+    change_counters(
+        CustomUser,
+        list(
+            Follow.objects.filter(user=instance).values_list(
+                "author_id", flat=True
+            )
+        ),
+        "followers_count",
+        -1,
+    )
+    change_counters(
+        Recipes,
+        list(
+            Favorites.objects.filter(user=instance).values_list(
+                "recipe_id", flat=True
+            )
+        ),
+        "favorites_count",
+        -1,
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+def recipe_changed(sender, instance, **kwargs):
+    """Сброс кэша отображения рецепта при его изменении."""
+    invalidate_recipe_fragments((instance.pk,))
+
+
+@receiver(pre_delete, sender=Recipes)
+def recipe_deleted(sender, instance, **kwargs):
+    """
+    Удаление ингредиентов рецепта из списков покупок пользователей до
+    каскадного удаления рецепта из их корзин.
+    """
+    IngredientsInShoppingList.objects.lock_recipes(
+        (instance.pk,), for_change=True
+    )
+    bump_shopping_list_versions(
+        IngredientsInShoppingList.objects.change_recipe(
+            instance.pk,
+            dict(
+                instance.ingredient_list.values_list("ingredient_id", "amount")
+            ),
+            {},
+        )
+    )
+
+
+@receiver((post_save, post_delete), sender=IngredientsInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    """
+    Сброс кэша отображения рецепта и запись рецепта в журнал изменений
+    индекса состава рецептов при изменении ингредиентов рецепта.
+    """
+    invalidate_recipe_fragments((instance.recipe_id,))
+    record_recipe_changes((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс кэша отображений рецептов при изменении их тегов."""
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_recipe_fragments((instance.pk,))
+    elif pk_set:
+        invalidate_recipe_fragments(pk_set)
+    else:
+        bump_version(RECIPES_VERSION)
@@ -0,0 +1,45 @@
+from recipes.models import Recipes
+from users.models import CustomUser
+
+
+def create_users(count, prefix="user", **fields):
+    """
+    Создание 'count' пользователей с именами '<prefix>-<номер>' одним
+    запросом. Пароль не задан (вход по паролю невозможен), значения остальных
+    полей можно переопределить в 'fields'.
+    """
+    fields = {"first_name": "Имя", "last_name": "Фамилия", **fields}
+    return CustomUser.objects.bulk_create(
+        CustomUser(
+            username=f"{prefix}-{index}",
+            email=f"{prefix}-{index}@foodgram.local",
+            password="!",
+            **fields,
+        )
+        for index in range(count)
+    )
+
+
+def create_recipes(authors, cooking_time=10, **fields):
+    """
+    Создание рецептов одним запросом: по рецепту для каждого элемента
+    'authors' (автор может повторяться). Время приготовления 'cooking_time'
+    задается числом или функцией от номера рецепта, значения остальных полей
+    можно переопределить в 'fields'.
+    """
+    fields = {
+        "text": "Тестовый рецепт",
+        "image": "recipes/images/test.png",
+        **fields,
+    }
+    return Recipes.objects.bulk_create(
+        Recipes(
+            author=author,
+            name=f"Рецепт {index}",
+            cooking_time=(
+                cooking_time(index) if callable(cooking_time) else cooking_time
+            ),
+            **fields,
+        )
+        for index, author in enumerate(authors)
+    )
@@ -0,0 +1,64 @@
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredients
+
+
+class CatalogCacheTest(TestCase):
+    """Кэширование списка ингредиентов с ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f"ингредиент {index}", measurement_unit="г")
+            for index in range(10)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, params=None, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/ingredients/", params, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, len(context)
+
+    def test_host_not_in_key(self):
+        first, queries = self.get(HTTP_HOST="first.example")
+        self.assertGreater(queries, 0)
+        second, queries = self.get(HTTP_HOST="second.example")
+        self.assertEqual(queries, 0)
+        self.assertTrue(
+            first.json()["next"].startswith("http://first.example/")
+        )
+        self.assertTrue(
+            second.json()["next"].startswith("http://second.example/")
+        )
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_pagination_params_in_key(self):
+        first, _ = self.get({"limit": 2})
+        cursor = parse_qs(urlsplit(first.json()["next"]).query)["cursor"][0]
+        second, queries = self.get({"cursor": cursor, "limit": 2})
+        self.assertGreater(queries, 0)
+        self.assertNotEqual(first.json()["results"], second.json()["results"])
+        _, queries = self.get({"limit": 2, "cursor": cursor})
+        self.assertEqual(queries, 0)
+
+    def test_other_params_not_cached(self):
+        self.get({"junk": 1})
+        _, queries = self.get({"junk": 1})
+        self.assertGreater(queries, 0)
+
+    def test_not_modified(self):
+        response, _ = self.get()
+        response = self.client.get(
+            "/api/ingredients/", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,145 @@
+from io import StringIO
+
+from django.contrib.admin import helpers
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+
+from recipes.models import Favorites, Ingredients, Recipes, Tags
+from users.models import CustomUser, Follow
+
+from .fixtures import create_recipes, create_users
+
+GIF = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04"
+    b"\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D"
+    b"\x01\x00;"
+)
+ADMIN_URL = "/admin/recipes/recipes/"
+
+
+class CountersTest(TestCase):
+    """
+    Счетчики рецептов и подписчиков пользователей и добавлений рецептов в
+    избранное при изменениях через панель администратора и при удалении
+    пользователей.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            username="admin", email="admin@foodgram.local", password="!"
+        )
+        cls.users = create_users(3)
+        cls.tag = Tags.objects.create(
+            name="Завтрак", slug="breakfast", color="#000000"
+        )
+        cls.ingredient = Ingredients.objects.create(
+            name="мука", measurement_unit="г"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assert_counters(self):
+        for user in CustomUser.objects.all():
+            self.assertEqual(user.recipes_count, user.recipes.count())
+            self.assertEqual(user.followers_count, user.following.count())
+        for recipe in Recipes.objects.all():
+            self.assertEqual(recipe.favorites_count, recipe.favorites.count())
+
+    def save_recipe(self, url, author, ingredients=1):
+        """
+        Сохранение рецепта формой панели администратора; 'ingredients' -
+        количество добавляемых строк ингредиентов (0 или 1).
+        """
+        response = self.client.post(
+            url,
+            {
+                "name": "Рецепт",
+                "author": author.id,
+                "text": "Тестовый рецепт",
+                "tags": [self.tag.id],
+                "image": SimpleUploadedFile(
+                    "test.gif", GIF, content_type="image/gif"
+                ),
+                "cooking_time": 10,
+                "ingredient_list-TOTAL_FORMS": ingredients,
+                "ingredient_list-INITIAL_FORMS": 0,
+                "ingredient_list-0-ingredient": self.ingredient.id,
+                "ingredient_list-0-amount": 100,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_admin_recipe_add_and_change(self):
+        first, second, _ = self.users
+        self.save_recipe(f"{ADMIN_URL}add/", first)
+        self.assert_counters()
+        recipe = Recipes.objects.get(author=first)
+        self.save_recipe(
+            f"{ADMIN_URL}{recipe.id}/change/", second, ingredients=0
+        )
+        self.assert_counters()
+        self.assertEqual(
+            CustomUser.objects.get(pk=second.pk).recipes_count, 1
+        )
+
+    def test_admin_recipe_delete(self):
+        first, second, _ = self.users
+        recipes = create_recipes([first, first, first, second])
+        call_command("reconcilecounters", stdout=StringIO())
+        response = self.client.post(
+            f"{ADMIN_URL}{recipes[0].id}/delete/", {"post": "yes"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_counters()
+        response = self.client.post(
+            ADMIN_URL,
+            {
+                "action": "delete_selected",
+                "post": "yes",
+                helpers.ACTION_CHECKBOX_NAME: [
+                    recipe.id for recipe in recipes[1:]
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_counters()
+        self.assertFalse(Recipes.objects.exists())
+
+    def test_user_delete(self):
+        first, second, third = self.users
+        recipes = create_recipes([second, third])
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for user, author in (
+                (first, second),
+                (first, third),
+                (third, second),
+            )
+        )
+        Favorites.objects.bulk_create(
+            Favorites(user=user, recipe=recipe)
+            for user in (first, third)
+            for recipe in recipes
+        )
+        call_command("reconcilecounters", stdout=StringIO())
+        first.delete()
+        self.assert_counters()
+        self.assertEqual(
+            CustomUser.objects.get(pk=second.pk).followers_count, 1
+        )
+        self.assertEqual(
+            Recipes.objects.get(pk=recipes[0].pk).favorites_count, 1
+        )
+        response = self.client.post(
+            "/admin/users/customuser/",
+            {
+                "action": "delete_selected",
+                "post": "yes",
+                helpers.ACTION_CHECKBOX_NAME: [third.id],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assert_counters()
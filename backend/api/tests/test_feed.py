@@ -0,0 +1,52 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import RecipesInFeed
+from users.models import CustomUser, Follow
+
+from .fixtures import create_recipes, create_users
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTest(TestCase):
+    """Лента рецептов авторов, на которых подписан пользователь."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, author, popular_author, other = create_users(4)
+        Follow.objects.bulk_create(
+            Follow(user=user, author=popular_author)
+            for user in (cls.user, other)
+        )
+        Follow.objects.create(user=cls.user, author=author)
+        CustomUser.objects.filter(pk=popular_author.pk).update(
+            followers_count=2
+        )
+        recipes = create_recipes([author, popular_author, other] * 4)
+        RecipesInFeed.objects.rebuild()
+        RecipesInFeed.objects.filter(
+            author=popular_author, recipe__in=recipes[-3:]
+        ).delete()
+        cls.expected = [
+            recipe.id
+            for recipe in reversed(recipes)
+            if recipe.author_id != other.id
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages(self):
+        ids = []
+        pages = []
+        url, params = "/api/recipes/feed/", {"limit": 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            ids += [recipe["id"] for recipe in response.data["results"]]
+            url, params = response.data["next"], None
+        self.assertEqual(ids, self.expected)
+        response = self.client.get(pages[-1]["previous"])
+        self.assertEqual(response.data["results"], pages[-2]["results"])
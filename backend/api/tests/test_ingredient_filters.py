@@ -0,0 +1,154 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.search import get_recipe_ingredient_index
+from recipes.models import Ingredients, IngredientsInRecipe
+
+from .fixtures import create_recipes, create_users
+
+
+class IngredientFiltersTest(TestCase):
+    """Фильтры рецептов по имеющимся и исключенным ингредиентам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_users(1)[0]
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit="г")
+            for name in ("мука", "яйца", "молоко", "сахар")
+        )
+        cls.recipes = create_recipes([author] * 3)
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=cls.recipes[recipe],
+                ingredient=cls.ingredients[ingredient],
+                amount=1,
+            )
+            for recipe, ingredients in enumerate(((0, 1), (0, 1, 2), (2, 3)))
+            for ingredient in ingredients
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def ids(self, *positions):
+        """Идентификаторы ингредиентов по номерам через запятую."""
+        return ",".join(
+            str(self.ingredients[position].id) for position in positions
+        )
+
+    def get_recipes(self, params):
+        response = self.client.get("/api/recipes/", params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_has_ingredients_coverage(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        pantry = self.ids(0, 1)
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": pantry}), [first]
+        )
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": pantry, "coverage": 0.5}),
+            [first, second],
+        )
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": pantry, "coverage": 0}),
+            [first, second],
+        )
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": self.ids(0, 2, 3)}),
+            [third],
+        )
+
+    def test_exclude_ingredients(self):
+        first = self.recipes[0].id
+        self.assertEqual(
+            self.get_recipes({"exclude_ingredients": self.ids(2)}), [first]
+        )
+        self.assertEqual(
+            self.get_recipes(
+                {
+                    "has_ingredients": self.ids(0, 1),
+                    "exclude_ingredients": self.ids(2),
+                    "coverage": 0,
+                }
+            ),
+            [first],
+        )
+
+    def test_unknown_ingredients_ignored(self):
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": 3000000000}), []
+        )
+        self.assertEqual(
+            len(self.get_recipes({"exclude_ingredients": 3000000000})), 3
+        )
+        self.assertEqual(
+            self.get_recipes(
+                {"has_ingredients": 3000000000, "count": "approximate"}
+            ),
+            [],
+        )
+
+    def test_invalid_values(self):
+        for params in (
+            {"has_ingredients": -1},
+            {"exclude_ingredients": -1},
+            {"has_ingredients": 0},
+            {"has_ingredients": self.ids(0), "coverage": 2},
+            {"has_ingredients": self.ids(0), "coverage": -0.5},
+        ):
+            response = self.client.get("/api/recipes/", params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_index_updated_incrementally(self):
+        index = get_recipe_ingredient_index()
+        recipe = self.recipes[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientsInRecipe.objects.filter(recipe=recipe).delete()
+            IngredientsInRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredients[0], amount=1
+            )
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": self.ids(0)}), [recipe.id]
+        )
+        self.assertIs(get_recipe_ingredient_index(), index)
+
+    def test_index_rebuilt_after_lost_changes(self):
+        index = get_recipe_ingredient_index()
+        recipe = self.recipes[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientsInRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredients[1], amount=1
+            )
+            IngredientsInRecipe.objects.filter(
+                recipe=recipe, ingredient=self.ingredients[2]
+            ).delete()
+        cache.delete(
+            f"recipe-ingredient-change:{index.version}:{index.applied + 1}"
+        )
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": self.ids(1, 3)}), [recipe.id]
+        )
+        self.assertIsNot(get_recipe_ingredient_index(), index)
+
+    def test_index_rebuilt_after_counter_reset(self):
+        recipe = self.recipes[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientsInRecipe.objects.filter(
+                recipe=recipe, ingredient=self.ingredients[3]
+            ).delete()
+        index = get_recipe_ingredient_index()
+        cache.delete(index.changes_key)
+        for ingredient in self.ingredients[:2]:
+            with self.captureOnCommitCallbacks(execute=True):
+                IngredientsInRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+        self.assertEqual(
+            self.get_recipes({"has_ingredients": self.ids(2)}), []
+        )
+        self.assertIsNot(get_recipe_ingredient_index(), index)
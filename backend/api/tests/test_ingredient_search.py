@@ -0,0 +1,122 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.search import FUZZY_DEPTH, get_ingredient_index, word_starts
+from recipes.models import Ingredients
+
+INGREDIENT_NAMES = (
+    "молоко",
+    "кокосовое молоко",
+    "молоко сгущенное",
+    "малина",
+    "мак",
+    "макароны",
+    "картофель",
+    "картофель молодой",
+    "помидоры черри",
+    "помидоры",
+    "сахар",
+    "сахарная пудра",
+    "соль",
+    "сыр пармезан",
+    "огурцы малосольные",
+)
+FUZZY_QUERIES = (
+    "м", "ма", "мак", "малоко", "молако", "картофел", "картофль",
+    "помидоры чери", "сах", "сол", "сыр", "пармизан", "огрцы", "vjkjrj",
+)
+
+
+def prefix_distance(name, text):
+    """
+    Наименьшее расстояние Левенштейна между 'name' и началом 'text'
+    (полный перебор для сверки с индексом).
+    """
+    row = list(range(len(name) + 1))
+    best = row[-1]
+    for char in text:
+        current = [row[0] + 1]
+        for column, name_char in enumerate(name, 1):
+            current.append(
+                min(
+                    current[column - 1] + 1,
+                    row[column] + 1,
+                    row[column - 1] + (name_char != char),
+                )
+            )
+        row = current
+        best = min(best, row[-1])
+    return best
+
+
+class IngredientFuzzySearchTest(TestCase):
+    """Нечеткий поиск ингредиентов по индексу и запросом к базе данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit="г")
+            for name in INGREDIENT_NAMES
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, name, **params):
+        response = self.client.get(
+            "/api/ingredients/", {"name": name, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.data]
+
+    def expected(self, index, name):
+        """Результаты нечеткого поиска полным перебором начал слов."""
+        limit = min(2, len(name) // 3)
+        name = name[:FUZZY_DEPTH]
+        matches = {}
+        for position, ingredient in enumerate(index.names):
+            for word, start in enumerate(word_starts(ingredient)):
+                match = (
+                    prefix_distance(name, start[:FUZZY_DEPTH]),
+                    word,
+                )
+                if match[0] <= limit:
+                    matches[position] = min(
+                        match, matches.get(position, match)
+                    )
+        return [
+            index.ingredients[position]
+            for position in sorted(
+                matches, key=lambda position: (matches[position], position)
+            )
+        ]
+
+    @override_settings(INGREDIENT_FUZZY_MAX_DISTANCE=2)
+    def test_index_matches_full_scan(self):
+        index = get_ingredient_index()
+        for name in FUZZY_QUERIES:
+            self.assertEqual(
+                index.fuzzy_search((name,)), self.expected(index, name), name
+            )
+
+    def test_fuzzy_search(self):
+        expected = [
+            "молоко сгущенное",
+            "молоко",
+            "огурцы малосольные",
+            "кокосовое молоко",
+            "картофель молодой",
+        ]
+        self.assertEqual(self.search("малоко", fuzzy="true"), expected)
+        self.assertEqual(self.search("vjkjrj", fuzzy="true")[:2], expected[:2])
+
+    @override_settings(INGREDIENT_SEARCH_IN_MEMORY=False)
+    def test_fuzzy_search_in_database(self):
+        with CaptureQueriesContext(connection) as context:
+            names = self.search("vjkjrj", fuzzy="true")
+        self.assertEqual(len(context), 1)
+        self.assertIn("молоко", names)
@@ -0,0 +1,39 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .fixtures import create_recipes, create_users
+
+
+class CursorPaginationTest(TestCase):
+    """Курсорная паджинация списка рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_users(1)[0]
+        cls.recipes = create_recipes(
+            [author] * 5, cooking_time=lambda index: index + 1
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_default_ordering(self):
+        response = self.client.get(
+            "/api/recipes/", {"pagination": "cursor", "limit": 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.data)
+        first_page = [recipe["id"] for recipe in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, 200)
+        second_page = [recipe["id"] for recipe in response.data["results"]]
+        expected = sorted((recipe.id for recipe in self.recipes), reverse=True)
+        self.assertEqual(first_page + second_page, expected[:4])
+
+    def test_custom_ordering_rejected(self):
+        response = self.client.get(
+            "/api/recipes/",
+            {"pagination": "cursor", "ordering": "cooking_time"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("pagination", response.data)
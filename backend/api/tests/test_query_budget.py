@@ -0,0 +1,132 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.cache import recipe_fragment_keys
+from recipes.models import (
+    Favorites,
+    Ingredients,
+    IngredientsInRecipe,
+    Recipes,
+    ShoppingCart,
+    Tags,
+)
+from users.models import CustomUser
+
+from .fixtures import create_recipes, create_users
+
+RECIPES_LIST_QUERIES = 6
+RECIPES_DETAIL_QUERIES = 4
+
+
+class RecipesQueryBudgetTest(TestCase):
+    """
+    Количество запросов к базе данных при получении списка и отдельного
+    рецепта не зависит от размера страницы и числа тегов и ингредиентов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = Tags.objects.bulk_create(
+            Tags(name=slug, slug=slug, color=f"#00000{index}")
+            for index, slug in enumerate(("breakfast", "lunch", "dinner"))
+        )
+        ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f"ингредиент {index}", measurement_unit="г")
+            for index in range(10)
+        )
+        cls.users = create_users(3)
+        recipes = create_recipes(
+            (author for author in cls.users for _ in range(10)),
+            cooking_time=lambda index: index % 10 + 1,
+        )
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=recipe, ingredient=ingredient, amount=10
+            )
+            for recipe in recipes
+            for ingredient in ingredients[: recipe.cooking_time]
+        )
+        Recipes.tags.through.objects.bulk_create(
+            Recipes.tags.through(recipes=recipe, tags=tag)
+            for recipe in recipes
+            for tag in tags[: recipe.cooking_time % 3 + 1]
+        )
+        for model in (Favorites, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=cls.users[0], recipe=recipe)
+                for recipe in recipes[::2]
+            )
+        cls.recipe = recipes[-1]
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def count_queries(self, client, url, params=None):
+        """Количество запросов при повторном обращении к эндпоинту."""
+        client.get(url, params)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_recipes_list(self):
+        for client in (self.anonymous, self.client):
+            counts = {
+                limit: self.count_queries(
+                    client, "/api/recipes/", {"limit": limit}
+                )
+                for limit in (1, 10, 30)
+            }
+            self.assertEqual(len(set(counts.values())), 1, counts)
+            self.assertLessEqual(counts[1], RECIPES_LIST_QUERIES)
+
+    def test_recipes_list_without_cache(self):
+        for limit in (1, 30):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get("/api/recipes/", {"limit": limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(context), RECIPES_LIST_QUERIES)
+
+    def test_recipes_detail(self):
+        for client in (self.anonymous, self.client):
+            self.assertLessEqual(
+                self.count_queries(client, f"/api/recipes/{self.recipe.id}/"),
+                RECIPES_DETAIL_QUERIES,
+            )
+
+    def relation_queries(self):
+        """
+        Запросы автора, тегов и ингредиентов при получении списка рецептов.
+        """
+        tables = (
+            CustomUser._meta.db_table,
+            Tags._meta.db_table,
+            IngredientsInRecipe._meta.db_table,
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/recipes/", {"limit": 10})
+        self.assertEqual(response.status_code, 200)
+        return [
+            query["sql"]
+            for query in context.captured_queries
+            if any(f'"{table}"' in query["sql"] for table in tables)
+        ]
+
+    def test_relations_loaded_for_cache_misses(self):
+        self.relation_queries()
+        self.assertEqual(self.relation_queries(), [])
+        cache.delete(recipe_fragment_keys((self.recipe.id,))[self.recipe.id])
+        queries = self.relation_queries()
+        self.assertEqual(len(queries), 3)
+        for sql, pk in zip(
+            queries,
+            (self.recipe.author_id, self.recipe.id, self.recipe.id),
+        ):
+            self.assertIn(f" IN ({pk})", sql)
@@ -0,0 +1,319 @@
+import json
+from io import StringIO
+from itertools import combinations
+from random import Random
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.cache import SHOPPING_LIST_VERSION, bump_version
+from recipes.models import (
+    Favorites,
+    Ingredients,
+    IngredientsInRecipe,
+    IngredientsInShoppingList,
+    Recipes,
+    RecipesInFeed,
+    ShoppingCart,
+    Tags,
+)
+from users.models import CustomUser, Follow
+
+from .fixtures import create_users
+
+USERS = 800
+RECIPES_PER_USER = 10
+FOLLOWS_PER_USER = 5
+LARGE_TABLES = {
+    CustomUser._meta.db_table,
+    Follow._meta.db_table,
+    Recipes._meta.db_table,
+    Recipes.tags.through._meta.db_table,
+    IngredientsInRecipe._meta.db_table,
+    Favorites._meta.db_table,
+    ShoppingCart._meta.db_table,
+    IngredientsInShoppingList._meta.db_table,
+    RecipesInFeed._meta.db_table,
+}
+MAX_SCANNED_SHARE = 0.05
+PLANNER_SETTINGS = ("enable_seqscan", "enable_hashjoin", "enable_mergejoin")
+RECIPE_WORDS = (
+    "борщ", "пирог", "салат", "суп", "каша", "омлет", "плов", "рагу",
+    "запеканка", "блины", "оладьи", "котлеты", "гуляш", "лазанья", "паста",
+    "ризотто", "пудинг", "кекс", "морс", "компот",
+)
+RECIPE_FILTERS = {
+    "tags": ["breakfast", "dinner"],
+    "author": None,
+    "is_favorited": 1,
+    "is_in_shopping_cart": 1,
+    "search": "пирог",
+    "cooking_time_max": 60,
+    "has_ingredients": None,
+}
+SELECTIVE_FILTERS = (
+    "author",
+    "is_favorited",
+    "is_in_shopping_cart",
+    "search",
+    "has_ingredients",
+)
+RECIPE_ORDERINGS = (
+    None,
+    "-pub_date",
+    "cooking_time",
+    "-popularity",
+    "popular",
+)
+EXPORT_FORMATS = ("txt", "csv", "json")
+QUERY_BUDGETS = {
+    "recipes-list": 6,
+    "recipes-detail": 4,
+    "recipes-feed": 4,
+    "users-list": 2,
+    "subscriptions": 3,
+    "ingredients-search": 0,
+    "ingredients-search-sql": 1,
+    "download-shopping-cart": 0,
+    "download-shopping-cart-uncached": 1,
+}
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "Планы запросов проверяются в PostgreSQL.",
+)
+class QueryPlansTest(TestCase):
+    """
+    Проверка основных эндпоинтов API на тестовом наборе данных: количество
+    запросов к базе данных не превышает бюджета эндпоинта, а ни один запрос
+    не читает большую долю строк большой таблицы.
+
+    Каждый запрос повторно выполняется с EXPLAIN ANALYZE (с отключенными
+    последовательным сканированием и соединениями хешированием и слиянием,
+    чтобы на небольшом наборе данных планировщик выбирал индексы, когда они
+    применимы). Запрос считается
+    регрессией, если план содержит Seq Scan большой таблицы либо узел
+    сканирования большой таблицы прочитал (с учетом отброшенных фильтром
+    строк) больше MAX_SCANNED_SHARE ее строк. Запросы COUNT(*) проверяются
+    так же, поэтому списки с неселективными фильтрами запрашиваются с
+    приблизительным подсчетом (count=approximate), а точный подсчет
+    проверяется для селективных фильтров. Перед сбором статистики списки
+    ожидающих записей GIN индексов переносятся в индексы (как это делает
+    автоочистка), иначе планировщик считает поиск по ним слишком дорогим.
+    Статистика собирается и до построения списков покупок: без нее
+    планировщик может выбрать для их агрегации вложенные циклы по полным
+    таблицам.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        random = Random(0)
+        for index, slug in enumerate(RECIPE_FILTERS["tags"] + ["lunch"]):
+            Tags.objects.create(
+                name=slug, slug=slug, color=f"#00000{index}"
+            )
+        tags = list(Tags.objects.values_list("id", flat=True))
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f"ингредиент {index}", measurement_unit="г")
+            for index in range(100)
+        )
+        ingredients = list(Ingredients.objects.values_list("id", flat=True))
+        users = create_users(USERS, prefix="plan-user")
+        recipes = Recipes.objects.bulk_create(
+            Recipes(
+                author=user,
+                name=f"{random.choice(RECIPE_WORDS)} {user.id}-{index}",
+                text="Тестовый рецепт для проверки планов запросов",
+                image="recipes/images/plan.png",
+                cooking_time=random.randint(1, 120),
+            )
+            for user in users
+            for index in range(RECIPES_PER_USER)
+        )
+        recipe_ids = [recipe.id for recipe in recipes]
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe_id=recipe, ingredient_id=ingredient, amount=10
+            )
+            for recipe in recipe_ids
+            for ingredient in random.sample(ingredients, 8)
+        )
+        Recipes.tags.through.objects.bulk_create(
+            Recipes.tags.through(recipes_id=recipe, tags_id=tag)
+            for recipe in recipe_ids
+            for tag in random.sample(tags, 2)
+        )
+        for model in (Favorites, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe_id=recipe)
+                for user in users
+                for recipe in random.sample(recipe_ids, 20)
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        IngredientsInShoppingList.objects.rebuild()
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for user in users
+            for author in random.sample(users, FOLLOWS_PER_USER + 1)
+            if author != user
+        )
+        call_command("reconcilecounters", stdout=StringIO())
+        RecipesInFeed.objects.rebuild()
+        call_command("popularity", stdout=StringIO())
+        cls.user = users[0]
+        cls.recipe = recipe_ids[0]
+        cls.ingredients = random.sample(ingredients, 20)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT gin_clean_pending_list(pg_class.oid) FROM pg_class "
+                "JOIN pg_am ON pg_am.oid = pg_class.relam "
+                "WHERE pg_am.amname = 'gin' "
+                "AND pg_class.relnamespace = 'public'::regnamespace"
+            )
+            cursor.execute("ANALYZE")
+            cursor.execute(
+                "SELECT relname, reltuples FROM pg_class "
+                "WHERE relname = ANY(%s)",
+                [list(LARGE_TABLES)],
+            )
+            cls.table_rows = dict(cursor.fetchall())
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_list(self):
+        filters = dict(
+            RECIPE_FILTERS,
+            author=self.user.id,
+            has_ingredients=",".join(map(str, self.ingredients)),
+        )
+        for size in range(len(filters) + 1):
+            for names in combinations(filters, size):
+                for ordering in RECIPE_ORDERINGS:
+                    params = {name: filters[name] for name in names}
+                    params["count"] = "approximate"
+                    if ordering:
+                        params["ordering"] = ordering
+                    self.check_endpoint(
+                        "recipes-list", "/api/recipes/", params
+                    )
+        for name in SELECTIVE_FILTERS:
+            self.check_endpoint(
+                "recipes-list", "/api/recipes/", {name: filters[name]}
+            )
+        self.check_endpoint(
+            "recipes-list", "/api/recipes/", {"pagination": "cursor"}
+        )
+
+    def test_recipes_detail(self):
+        self.check_endpoint("recipes-detail", f"/api/recipes/{self.recipe}/")
+
+    def test_recipes_feed(self):
+        self.check_endpoint("recipes-feed", "/api/recipes/feed/")
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=0):
+            self.check_endpoint("recipes-feed", "/api/recipes/feed/")
+
+    def test_users(self):
+        self.check_endpoint(
+            "users-list", "/api/users/", {"count": "approximate"}
+        )
+        for params in ({}, {"recipes_limit": 3}):
+            self.check_endpoint(
+                "subscriptions", "/api/users/subscriptions/", params
+            )
+
+    def test_ingredients_search(self):
+        for params in ({"name": "а"}, {"name": "byuhtlbtyn", "fuzzy": 1}):
+            self.check_endpoint(
+                "ingredients-search", "/api/ingredients/", params
+            )
+            with override_settings(INGREDIENT_SEARCH_IN_MEMORY=False):
+                self.check_endpoint(
+                    "ingredients-search-sql", "/api/ingredients/", params
+                )
+
+    def test_download_shopping_cart(self):
+        shopping_list_version = SHOPPING_LIST_VERSION.format(
+            user_id=self.user.id
+        )
+        for export_format in EXPORT_FORMATS:
+            params = {"format": export_format}
+            self.check_endpoint(
+                "download-shopping-cart",
+                "/api/recipes/download_shopping_cart/",
+                params,
+            )
+            self.check_endpoint(
+                "download-shopping-cart-uncached",
+                "/api/recipes/download_shopping_cart/",
+                params,
+                before=lambda: bump_version(shopping_list_version),
+            )
+
+    def check_endpoint(self, name, url, params=None, before=None):
+        """
+        Запрос к эндпоинту (после предварительного запроса, заполняющего
+        кэши и индексы процесса, и вызова 'before'), проверка количества
+        запросов к базе данных и планов выполнения каждого из них.
+        """
+        self.get(url, params)
+        if before is not None:
+            before()
+        with CaptureQueriesContext(connection) as context:
+            response = self.get(url, params)
+        label = f"{url} {params or ''}"
+        self.assertEqual(response.status_code, 200, label)
+        self.assertLessEqual(len(context), QUERY_BUDGETS[name], label)
+        for query in context.captured_queries:
+            scans = self.large_scans(query["sql"])
+            self.assertFalse(scans, f"{label}: {scans}\n{query['sql']}")
+
+    def get(self, url, params):
+        """Запрос к эндпоинту с чтением потокового ответа целиком."""
+        response = self.client.get(url, params)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def large_scans(self, sql):
+        """
+        Узлы сканирования больших таблиц в плане выполнения запроса: Seq
+        Scan и узлы, прочитавшие больше MAX_SCANNED_SHARE строк таблицы.
+        Возвращает список пар (таблица, количество прочитанных строк).
+        """
+        with connection.cursor() as cursor:
+            for setting in PLANNER_SETTINGS:
+                cursor.execute(f"SET {setting} = off")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0]
+            finally:
+                for setting in PLANNER_SETTINGS:
+                    cursor.execute(f"RESET {setting}")
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return list(self.plan_scans(plan[0]["Plan"]))
+
+    def plan_scans(self, plan):
+        """Обход узлов плана PostgreSQL (см. large_scans)."""
+        table = plan.get("Relation Name")
+        if table in LARGE_TABLES:
+            rows = plan["Actual Loops"] * (
+                plan["Actual Rows"] + plan.get("Rows Removed by Filter", 0)
+            )
+            if (
+                plan["Node Type"] == "Seq Scan"
+                or rows > self.table_rows[table] * MAX_SCANNED_SHARE
+            ):
+                yield table, rows
+        for child in plan.get("Plans", ()):
+            yield from self.plan_scans(child)
@@ -0,0 +1,238 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import NotFound
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.test import APIClient
+
+from recipes.models import (
+    Favorites,
+    Ingredients,
+    IngredientsInRecipe,
+    IngredientsInShoppingList,
+    Recipes,
+    ShoppingCart,
+    Tags,
+)
+
+from .fixtures import create_recipes, create_users
+
+MISSING_ID = 999999
+
+
+def does_not_exist(pk_value):
+    """Текст ошибки поля идентификатора для несуществующего объекта."""
+    return PrimaryKeyRelatedField.default_error_messages[
+        "does_not_exist"
+    ].format(pk_value=pk_value)
+
+
+class RecipeWriteTest(TestCase):
+    """
+    Изменение рецепта: запись ингредиентов по разнице с сохраненными и
+    проверка идентификаторов тегов и ингредиентов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_users(1)[0]
+        cls.tags = Tags.objects.bulk_create(
+            Tags(name=slug, slug=slug, color=f"#00000{index}")
+            for index, slug in enumerate(("breakfast", "dinner"))
+        )
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit="г")
+            for name in ("мука", "сахар", "соль", "масло")
+        )
+        cls.recipe = create_recipes([cls.author])[0]
+        cls.recipe.tags.add(cls.tags[0])
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(
+                recipe=cls.recipe, ingredient=ingredient, amount=amount
+            )
+            for ingredient, amount in zip(cls.ingredients, (10, 20, 30))
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, ingredients, tags=None):
+        return self.client.patch(
+            f"/api/recipes/{self.recipe.id}/",
+            {
+                "tags": tags or [self.tags[0].id],
+                "ingredients": [
+                    {"id": ingredient_id, "amount": amount}
+                    for ingredient_id, amount in ingredients
+                ],
+                "name": self.recipe.name,
+                "text": self.recipe.text,
+                "cooking_time": self.recipe.cooking_time,
+            },
+            format="json",
+        )
+
+    def stored(self):
+        return {
+            item.ingredient_id: (item.pk, item.amount)
+            for item in IngredientsInRecipe.objects.filter(recipe=self.recipe)
+        }
+
+    def test_ingredients_diff(self):
+        flour, sugar, salt, butter = self.ingredients
+        before = self.stored()
+        response = self.patch(
+            ((flour.id, 15), (sugar.id, 20), (butter.id, 5))
+        )
+        self.assertEqual(response.status_code, 200)
+        after = self.stored()
+        self.assertEqual(
+            {key: amount for key, (_, amount) in after.items()},
+            {flour.id: 15, sugar.id: 20, butter.id: 5},
+        )
+        self.assertEqual(after[flour.id][0], before[flour.id][0])
+        self.assertEqual(after[sugar.id], before[sugar.id])
+        self.assertEqual(
+            {
+                ingredient["id"]: ingredient["amount"]
+                for ingredient in response.data["ingredients"]
+            },
+            {flour.id: 15, sugar.id: 20, butter.id: 5},
+        )
+
+    def test_unknown_ingredient(self):
+        for in_memory in (True, False):
+            with override_settings(INGREDIENT_SEARCH_IN_MEMORY=in_memory):
+                response = self.patch(
+                    ((self.ingredients[0].id, 1), (MISSING_ID, 1))
+                )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                response.data["ingredients"][1]["id"],
+                [does_not_exist(MISSING_ID)],
+            )
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_unknown_tag(self):
+        response = self.patch(
+            ((self.ingredients[0].id, 1),),
+            tags=[self.tags[0].id, MISSING_ID],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["tags"], [does_not_exist(MISSING_ID)]
+        )
+
+    def test_duplicate_ids(self):
+        flour = self.ingredients[0]
+        response = self.patch(((flour.id, 1), (flour.id, 2)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Ингредиенты не могут повторяться!", str(response.data))
+        response = self.patch(
+            ((flour.id, 1),), tags=[self.tags[0].id, self.tags[0].id]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(
+            "Нельзя использовать повторяющиеся теги!", str(response.data)
+        )
+        self.assertEqual(len(self.stored()), 3)
+
+
+class BatchTest(TestCase):
+    """Результаты пакетного добавления и удаления для каждого рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_users(1)[0]
+        cls.recipes = create_recipes([cls.user] * 3)
+        ingredient = Ingredients.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in cls.recipes
+        )
+        Favorites.objects.create(user=cls.user, recipe=cls.recipes[1])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[1])
+        IngredientsInShoppingList.objects.rebuild()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {"ids": ids}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_favorites_mixed_batch(self):
+        first, second, _ = (recipe.id for recipe in self.recipes)
+        results = self.batch(
+            "post",
+            "/api/recipes/favorite/",
+            [first, second, MISSING_ID, first],
+        )
+        self.assertEqual(
+            results,
+            [
+                {"id": first, "status": 201},
+                {
+                    "id": second,
+                    "status": 400,
+                    "errors": ["Рецепт уже добавлен в список избранного!"],
+                },
+                {
+                    "id": MISSING_ID,
+                    "status": 400,
+                    "errors": [does_not_exist(MISSING_ID)],
+                },
+            ],
+        )
+        self.assertEqual(
+            dict(
+                Recipes.objects.filter(pk__in=(first, second)).values_list(
+                    "pk", "favorites_count"
+                )
+            ),
+            {first: 1, second: 0},
+        )
+        results = self.batch(
+            "delete", "/api/recipes/favorite/", [first, MISSING_ID]
+        )
+        self.assertEqual(
+            results,
+            [
+                {"id": first, "status": 204},
+                {
+                    "id": MISSING_ID,
+                    "status": 404,
+                    "errors": [NotFound.default_detail],
+                },
+            ],
+        )
+
+    def test_shopping_cart_mixed_batch(self):
+        first, second, third = (recipe.id for recipe in self.recipes)
+        results = self.batch(
+            "post", "/api/recipes/shopping_cart/", [first, second, third]
+        )
+        self.assertEqual(
+            [(result["id"], result["status"]) for result in results],
+            [(first, 201), (second, 400), (third, 201)],
+        )
+        self.assertEqual(
+            IngredientsInShoppingList.objects.get(user=self.user).amount, 15
+        )
+        results = self.batch(
+            "delete", "/api/recipes/shopping_cart/", [second, MISSING_ID]
+        )
+        self.assertEqual(
+            [(result["id"], result["status"]) for result in results],
+            [(second, 204), (MISSING_ID, 404)],
+        )
+        self.assertEqual(
+            IngredientsInShoppingList.objects.get(user=self.user).amount, 10
+        )
@@ -0,0 +1,296 @@
+import json
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.utils import register_pdf_font
+from recipes.models import (
+    Favorites,
+    Ingredients,
+    IngredientsInRecipe,
+    IngredientsInShoppingList,
+    ShoppingCart,
+    Tags,
+)
+
+from .fixtures import create_recipes, create_users
+
+EXPORT_URL = "/api/recipes/download_shopping_cart/"
+
+
+def create_recipe_ingredients(recipes):
+    """
+    Ингредиенты 'мука' (г), 'яйца' (шт), 'молоко' (мл) и состав двух
+    рецептов: первый - мука 100 и яйца 2, второй - мука 200 и молоко 300.
+    """
+    ingredients = Ingredients.objects.bulk_create(
+        Ingredients(name=name, measurement_unit=unit)
+        for name, unit in (("мука", "г"), ("яйца", "шт"), ("молоко", "мл"))
+    )
+    IngredientsInRecipe.objects.bulk_create(
+        IngredientsInRecipe(
+            recipe=recipes[recipe],
+            ingredient=ingredients[ingredient],
+            amount=amount,
+        )
+        for recipe, ingredient, amount in (
+            (0, 0, 100),
+            (0, 1, 2),
+            (1, 0, 200),
+            (1, 2, 300),
+        )
+    )
+    return ingredients
+
+
+class ShoppingCartFromFavoritesTest(TestCase):
+    """Добавление избранных рецептов в корзину."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_users(1)[0]
+        ingredient = Ingredients.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        cls.recipes = create_recipes([cls.user] * 3)
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in cls.recipes
+        )
+        Favorites.objects.bulk_create(
+            Favorites(user=cls.user, recipe=recipe) for recipe in cls.recipes
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_from_favorites(self):
+        self.client.post(
+            f"/api/recipes/{self.recipes[0].id}/shopping_cart/"
+        )
+        response = self.client.post(
+            "/api/recipes/shopping_cart/from_favorites/"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["results"],
+            [
+                {"id": recipe.id, "status": 201}
+                for recipe in self.recipes[1:]
+            ],
+        )
+        self.assertEqual(
+            ShoppingCart.objects.filter(user=self.user).count(), 3
+        )
+        self.assertEqual(
+            IngredientsInShoppingList.objects.get(user=self.user).amount, 15
+        )
+        response = self.client.post(
+            "/api/recipes/shopping_cart/from_favorites/"
+        )
+        self.assertEqual(response.data["results"], [])
+
+
+class ShoppingListTest(TestCase):
+    """
+    Изменение списка покупок (IngredientsInShoppingList) при изменении
+    корзины и состава рецептов и его проверка командой shoppinglists.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = create_users(2)
+        cls.tag = Tags.objects.create(
+            name="Завтрак", slug="breakfast", color="#000000"
+        )
+        cls.recipes = create_recipes([cls.author] * 2)
+        cls.ingredients = create_recipe_ingredients(cls.recipes)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cart(self, method, recipe):
+        response = getattr(self.client, method)(
+            f"/api/recipes/{recipe.id}/shopping_cart/"
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def shopping_list(self):
+        return dict(
+            IngredientsInShoppingList.objects.filter(
+                user=self.user
+            ).values_list("ingredient__name", "amount")
+        )
+
+    def verify(self):
+        stdout = StringIO()
+        call_command("shoppinglists", "--verify", stdout=stdout)
+        return stdout.getvalue()
+
+    def test_cart_add_and_remove(self):
+        self.cart("post", self.recipes[0])
+        self.assertEqual(self.shopping_list(), {"мука": 100, "яйца": 2})
+        self.cart("post", self.recipes[1])
+        self.assertEqual(
+            self.shopping_list(), {"мука": 300, "яйца": 2, "молоко": 300}
+        )
+        self.cart("delete", self.recipes[0])
+        self.assertEqual(self.shopping_list(), {"мука": 200, "молоко": 300})
+        self.cart("delete", self.recipes[1])
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_recipe_edit(self):
+        self.cart("post", self.recipes[0])
+        self.cart("post", self.recipes[1])
+        flour, _, milk = self.ingredients
+        author_client = APIClient()
+        author_client.force_authenticate(self.author)
+        response = author_client.patch(
+            f"/api/recipes/{self.recipes[0].id}/",
+            {
+                "tags": [self.tag.id],
+                "ingredients": [
+                    {"id": flour.id, "amount": 50},
+                    {"id": milk.id, "amount": 10},
+                ],
+                "name": self.recipes[0].name,
+                "text": self.recipes[0].text,
+                "cooking_time": 10,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shopping_list(), {"мука": 250, "молоко": 310})
+        self.assertIn("в порядке", self.verify())
+
+    def test_verify_command(self):
+        self.cart("post", self.recipes[0])
+        self.assertIn("в порядке", self.verify())
+        IngredientsInShoppingList.objects.filter(user=self.user).update(
+            amount=1
+        )
+        with self.assertRaises(CommandError):
+            self.verify()
+        call_command("shoppinglists", stdout=StringIO())
+        self.assertIn("в порядке", self.verify())
+        self.assertEqual(self.shopping_list(), {"мука": 100, "яйца": 2})
+
+
+class ShoppingListExportTest(TestCase):
+    """Выгрузка списка покупок: форматы, кэширование и ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_users(1)[0]
+        cls.recipes = create_recipes([cls.user] * 2)
+        create_recipe_ingredients(cls.recipes)
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes
+        )
+        IngredientsInShoppingList.objects.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, params=None, **headers):
+        """Ответ эндпоинта выгрузки и содержимое файла."""
+        response = self.client.get(EXPORT_URL, params, **headers)
+        if response.streaming:
+            return response, b"".join(response.streaming_content)
+        return response, response.content
+
+    def test_formats(self):
+        expected = {
+            "txt": "text/plain; charset=utf-8",
+            "csv": "text/csv; charset=utf-8",
+            "json": "application/json",
+        }
+        contents = {}
+        for export_format, content_type in expected.items():
+            response, content = self.download({"format": export_format})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], content_type)
+            self.assertEqual(
+                response["Content-Disposition"],
+                f'attachment; filename="{self.user.username}'
+                f'_shopping_list.{export_format}"',
+            )
+            contents[export_format] = content.decode()
+        self.assertIn("- молоко (мл) - 300\n", contents["txt"])
+        self.assertIn("- мука (г) - 300\n", contents["txt"])
+        self.assertIn("- яйца (шт) - 2\n", contents["txt"])
+        self.assertEqual(
+            contents["csv"],
+            "Ингредиент,Единица измерения,Количество\r\n"
+            "молоко,мл,300\r\n"
+            "мука,г,300\r\n"
+            "яйца,шт,2\r\n",
+        )
+        data = json.loads(contents["json"])
+        self.assertEqual(data["user"], self.user.username)
+        self.assertEqual(
+            data["ingredients"],
+            [
+                {"name": "молоко", "measurement_unit": "мл", "amount": 300},
+                {"name": "мука", "measurement_unit": "г", "amount": 300},
+                {"name": "яйца", "measurement_unit": "шт", "amount": 2},
+            ],
+        )
+        self.assertEqual(self.download()[1].decode(), contents["txt"])
+
+    @skipUnless(register_pdf_font(), "Шрифт для PDF недоступен.")
+    def test_pdf(self):
+        response, content = self.download({"format": "pdf"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(content.startswith(b"%PDF"))
+
+    def test_unknown_format(self):
+        response, _ = self.download({"format": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached_export(self):
+        response, content = self.download({"format": "csv"})
+        self.assertTrue(response.streaming)
+        with CaptureQueriesContext(connection) as context:
+            response, cached = self.download({"format": "csv"})
+        self.assertEqual(len(context), 0)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(cached, content)
+
+    @override_settings(SHOPPING_LIST_CACHE_MAX_SIZE=10)
+    def test_large_export_not_cached(self):
+        self.download({"format": "csv"})
+        response, _ = self.download({"format": "csv"})
+        self.assertTrue(response.streaming)
+
+    def test_not_modified(self):
+        response, _ = self.download()
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as context:
+            response, content = self.download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(context), 0)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(content, b"")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                f"/api/recipes/{self.recipes[0].id}/shopping_cart/"
+            )
+        self.assertEqual(response.status_code, 204)
+        response, content = self.download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertNotIn("яйца", content.decode())
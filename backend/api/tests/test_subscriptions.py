@@ -0,0 +1,92 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from users.models import CustomUser, Follow
+
+from .fixtures import create_recipes, create_users
+
+
+class SubscriptionsTest(TestCase):
+    """Список подписок с ограничением количества рецептов авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *authors = create_users(3)
+        create_recipes(author for author in authors for _ in range(3))
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, author=author) for author in authors
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_recipes_counts(self, params):
+        response = self.client.get("/api/users/subscriptions/", params)
+        self.assertEqual(response.status_code, 200)
+        return [len(author["recipes"]) for author in response.data["results"]]
+
+    def test_recipes_limit(self):
+        self.assertEqual(self.get_recipes_counts({}), [3, 3])
+        self.assertEqual(
+            self.get_recipes_counts({"recipes_limit": 2}), [2, 2]
+        )
+        self.assertEqual(
+            self.get_recipes_counts({"recipes_limit": 0}), [0, 0]
+        )
+        self.assertEqual(
+            self.get_recipes_counts({"recipes_limit": "all"}), [3, 3]
+        )
+
+
+class SubscribeTest(TestCase):
+    """Подписка на авторов и счетчики подписчиков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = create_users(4)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_followers_counts(self):
+        for author in CustomUser.objects.all():
+            self.assertEqual(
+                author.followers_count, author.following.count()
+            )
+
+    def test_subscribe(self):
+        url = f"/api/users/{self.authors[0].id}/subscribe/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assert_followers_counts()
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assert_followers_counts()
+
+    def test_subscribe_batch(self):
+        first, second, third = (author.id for author in self.authors)
+        Follow.objects.create(user=self.user, author_id=first)
+        CustomUser.objects.filter(pk=first).update(followers_count=1)
+        response = self.client.post(
+            "/api/users/subscribe/",
+            {"ids": [first, second, second, self.user.id, 10**9]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            [400, 201, 400, 404],
+        )
+        self.assert_followers_counts()
+        response = self.client.delete(
+            "/api/users/subscribe/",
+            {"ids": [first, second, third]},
+            format="json",
+        )
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            [204, 204, 404],
+        )
+        self.assert_followers_counts()
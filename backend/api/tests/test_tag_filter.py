@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.filters import RecipeFilter
+from recipes.models import Recipes, Tags
+
+from .fixtures import create_recipes, create_users
+
+
+class TagFilterTest(TestCase):
+    """Фильтр рецептов по slug тегов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_users(1)[0]
+        cls.tags = Tags.objects.bulk_create(
+            Tags(name=slug, slug=slug, color=f"#00000{index}")
+            for index, slug in enumerate(("breakfast", "dinner"))
+        )
+        cls.recipes = create_recipes([author] * 2)
+        for recipe, tag in zip(cls.recipes, cls.tags):
+            recipe.tags.add(tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_filter_tags(self):
+        response = self.client.get(
+            "/api/recipes/", {"tags": ["breakfast", "dinner"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 2)
+        response = self.client.get("/api/recipes/", {"tags": "lunch"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tag_deleted_after_validation(self):
+        tag_filter = RecipeFilter()
+        queryset = Recipes.objects.all()
+        self.assertEqual(
+            list(tag_filter.filter_tags(queryset, "tags", ["lunch"])), []
+        )
+        queryset = tag_filter.filter_tags(
+            queryset, "tags", ["breakfast", "lunch"]
+        )
+        self.assertEqual(list(queryset), [self.recipes[0]])
@@ -1,55 +1,422 @@
+import csv
+import json
 from datetime import date
+from hashlib import sha256
+from io import BytesIO
+from itertools import chain
 
-from django.shortcuts import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.transaction import atomic
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.http import parse_etags
 from rest_framework import response, status
-from rest_framework.generics import get_object_or_404
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
 
-from recipes.models import Recipes
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
 
+from recipes.models import (
+    Favorites,
+    IngredientsInShoppingList,
+    Recipes,
+    ShoppingCart,
+)
 
+from .cache import (
+    SHOPPING_LIST_KEY,
+    SHOPPING_LIST_VERSION,
+    SHOPPING_LISTS_VERSION,
+    bump_shopping_list_versions,
+    get_version,
+)
+from .search import INGREDIENTS_VERSION
+
+PDF_FONT_NAME = "ShoppingListFont"
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Изменение счетчика 'field' объекта модели выражением F() без чтения
+    объекта. Значение счетчика не уменьшается ниже нуля.
+    """
+    change_counters(model, (pk,), field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """
+    Изменение счетчика 'field' нескольких объектов модели одним запросом
+    (см. change_counter).
+    """
+    if not pks:
+        return
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def user_list_changed(model, user_id, recipe_ids, sign):
+    """
+    Изменения, сопровождающие добавление (sign = 1) / удаление (sign = -1)
+    рецептов в корзину или избранное пользователя: для корзины - список
+    покупок пользователя (IngredientsInShoppingList) и метка версии его
+    выгрузки, для избранного - счетчики добавлений рецептов в избранное.
+    """
+    if not recipe_ids:
+        return
+    if model is ShoppingCart:
+        IngredientsInShoppingList.objects.add_recipes(
+            user_id, recipe_ids, sign
+        )
+        bump_shopping_list_versions((user_id,))
+    if model is Favorites:
+        change_counters(Recipes, recipe_ids, "favorites_count", sign)
+
+
+def recipe_field_message(serializer_name, code, **kwargs):
+    """Текст ошибки проверки поля 'recipe' сериализатора."""
+    field = serializer_name().fields["recipe"]
+    return field.error_messages[code].format(**kwargs)
+
+
+def recipe_field_error(serializer_name, code, **kwargs):
+    """
+    Ошибка проверки поля 'recipe' сериализатора в том же формате, что и при
+    проверке данных сериализатором.
+    """
+    raise ValidationError(
+        {"recipe": [recipe_field_message(serializer_name, code, **kwargs)]}
+    )
+
+
+def add_to_user_list(serializer_name, model, request, recipe_id):
+    """
+    Добавление рецепта одним запросом INSERT ... ON CONFLICT DO NOTHING (без
+    проверки наличия записи перед вставкой).
+    """
+    user = request.user
+    recipe, added = model.objects.add(
+        user.id, recipe_id, serializer_name.Meta.recipe_fields
+    )
+    if recipe is None:
+        recipe_field_error(
+            serializer_name, "does_not_exist", pk_value=recipe_id
+        )
+    if not added:
+        raise ValidationError({"errors": [serializer_name.Meta.message]})
+    user_list_changed(model, user.id, (recipe_id,), 1)
+    serializer = serializer_name(
+        model(user=user, recipe=recipe), context={"request": request}
+    )
+    return response.Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+def remove_from_user_list(model, request, recipe_id):
+    """Удаление рецепта одним запросом DELETE ... RETURNING."""
+    user = request.user
+    if not model.objects.remove(user.id, recipe_id):
+        raise NotFound
+    user_list_changed(model, user.id, (recipe_id,), -1)
+    return response.Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@atomic
 def serializer_add_delete(serializer_name, model, request, recipe_id):
     """
     Добавление / удаление рецепта в список избранного или корзину (список
-    покупок) пользователя.
+    покупок) пользователя. Изменение корзины в той же транзакции изменяет
+    список покупок пользователя (IngredientsInShoppingList) и метку версии
+    его выгрузки, изменение избранного - счетчик добавлений рецепта
+    в избранное.
     """
-    user = request.user
-    data = {"user": user.id, "recipe": recipe_id}
-    serializer = serializer_name(data=data, context={"request": request})
+    try:
+        recipe_id = int(recipe_id)
+    except (TypeError, ValueError):
+        if request.method != "POST":
+            raise NotFound
+        recipe_field_error(
+            serializer_name,
+            "incorrect_type",
+            data_type=type(recipe_id).__name__,
+        )
     if request.method == "POST":
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return response.Response(
-            serializer.data, status=status.HTTP_201_CREATED
+        return add_to_user_list(serializer_name, model, request, recipe_id)
+    return remove_from_user_list(model, request, recipe_id)
+
+
+def batch_result(object_id, code, error=None):
+    """
+    Результат пакетной операции для одного объекта: код ответа
+    соответствующего эндпоинта для одного объекта и текст ошибки.
+    """
+    result = {"id": object_id, "status": code}
+    if error is not None:
+        result["errors"] = [error]
+    return result
+
+
+@atomic
+def serializer_batch_add_delete(serializer_name, model, request, recipe_ids):
+    """
+    Пакетное добавление / удаление рецептов 'recipe_ids' в список избранного
+    или корзину пользователя в одной транзакции: записи добавляются одним
+    запросом INSERT ... ON CONFLICT DO NOTHING и удаляются одним запросом
+    DELETE ... RETURNING, список покупок и счетчики изменяются один раз для
+    всех рецептов. Без 'recipe_ids' удаляются все рецепты пользователя.
+    Возвращает результаты для каждого рецепта.
+    """
+    user = request.user
+    if request.method == "DELETE":
+        removed = model.objects.remove_many(user.id, recipe_ids)
+        user_list_changed(model, user.id, removed, -1)
+        results = [
+            batch_result(recipe_id, status.HTTP_204_NO_CONTENT)
+            if recipe_id in removed
+            else batch_result(
+                recipe_id, status.HTTP_404_NOT_FOUND, NotFound.default_detail
+            )
+            for recipe_id in (
+                sorted(removed) if recipe_ids is None else recipe_ids
+            )
+        ]
+        return response.Response({"results": results})
+    added = model.objects.add_many(user.id, recipe_ids)
+    user_list_changed(model, user.id, added, 1)
+    existing = set(
+        Recipes.objects.filter(
+            pk__in=set(recipe_ids) - added
+        ).values_list("pk", flat=True)
+    )
+    results = []
+    for recipe_id in recipe_ids:
+        if recipe_id in added:
+            results.append(batch_result(recipe_id, status.HTTP_201_CREATED))
+            continue
+        error = serializer_name.Meta.message
+        if recipe_id not in existing:
+            error = recipe_field_message(
+                serializer_name, "does_not_exist", pk_value=recipe_id
+            )
+        results.append(
+            batch_result(recipe_id, status.HTTP_400_BAD_REQUEST, error)
         )
-    get_object_or_404(
-        model, user=user, recipe=get_object_or_404(Recipes, id=recipe_id)
-    ).delete()
-    return response.Response(status=status.HTTP_204_NO_CONTENT)
+    return response.Response({"results": results})
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    Согласование формата ответа эндпоинтов выгрузки: параметр 'format'
+    в запросе задает формат файла, а не формат ответа API (ошибки
+    возвращаются первым из доступных рендереров).
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_rows(ingredients):
+    """
+    Строки списка покупок (название, единица измерения, количество),
+    читаемые из базы данных курсором по частям.
+    """
+    for ingredient in ingredients.iterator():
+        yield (
+            ingredient["ingredient__name"],
+            ingredient["ingredient__measurement_unit"],
+            ingredient["amount"],
+        )
+
+
+def shopping_list_txt(user, ingredients, today):
+    """Список покупок в виде текста."""
+    yield f"Список покупок пользователя: {user.username}\n\n"
+    yield f"Дата: {today:%Y-%m-%d}\n\n"
+    for name, measurement_unit, amount in shopping_list_rows(ingredients):
+        yield f"- {name} ({measurement_unit}) - {amount}\n"
+    yield f"\nFoodgram ({today:%Y})"
+
+
+def shopping_list_csv(user, ingredients, today):
+    """Список покупок в формате CSV (строка заголовков и строки списка)."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(("Ингредиент", "Единица измерения", "Количество"))
+    for row in shopping_list_rows(ingredients):
+        yield writer.writerow(row)
+
+
+def shopping_list_json(user, ingredients, today):
+    """Список покупок в формате JSON, ингредиенты выводятся по одному."""
+    yield (
+        f'{{"user": {json.dumps(user.username, ensure_ascii=False)}, '
+        f'"date": "{today:%Y-%m-%d}", "ingredients": ['
+    )
+    separator = ""
+    for name, measurement_unit, amount in shopping_list_rows(ingredients):
+        item = {
+            "name": name,
+            "measurement_unit": measurement_unit,
+            "amount": amount,
+        }
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ", "
+    yield "]}"
+
+
+def register_pdf_font():
+    """
+    Регистрация шрифта с поддержкой кириллицы (SHOPPING_LIST_PDF_FONT).
+    Возвращает False, если библиотека reportlab или файл шрифта недоступны.
+    """
+    if canvas is None:
+        return False
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return True
+    try:
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    except TTFError:
+        return False
+    return True
+
+
+def shopping_list_pdf(user, ingredients, today):
+    """
+    Список покупок в формате PDF. Документ PDF заканчивается таблицей
+    смещений всех объектов, поэтому он формируется в памяти и отдается
+    после построения последней страницы.
+    """
+    buffer = BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    lines = chain(
+        (
+            f"Список покупок пользователя: {user.username}",
+            f"Дата: {today:%Y-%m-%d}",
+            "",
+        ),
+        (
+            f"- {name} ({measurement_unit}) - {amount}"
+            for name, measurement_unit, amount in shopping_list_rows(
+                ingredients
+            )
+        ),
+        ("", f"Foodgram ({today:%Y})"),
+    )
+    position = height - PDF_MARGIN
+    for line in lines:
+        if position < PDF_MARGIN:
+            document.showPage()
+            position = height - PDF_MARGIN
+        document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+        document.drawString(PDF_MARGIN, position, line)
+        position -= PDF_LINE_HEIGHT
+    document.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    "txt": ("text/plain; charset=utf-8", shopping_list_txt),
+    "csv": ("text/csv; charset=utf-8", shopping_list_csv),
+    "json": ("application/json", shopping_list_json),
+    "pdf": ("application/pdf", shopping_list_pdf),
+}
+
+
+def shopping_list_signature(user, export_format, today):
+    """
+    Подпись выгрузки списка покупок - хэш меток версий списка покупок
+    пользователя, всех списков покупок и ингредиентов, а также данных,
+    входящих в файл. Используется как ключ кэша и ETag выгрузки.
+    """
+    versions = (
+        get_version(SHOPPING_LIST_VERSION.format(user_id=user.id)),
+        get_version(SHOPPING_LISTS_VERSION),
+        get_version(INGREDIENTS_VERSION),
+    )
+    data = f"{user.id}:{user.username}:{export_format}:{today}:{versions}"
+    return sha256(data.encode()).hexdigest()
+
+
+def cached_export(key, chunks):
+    """
+    Передача частей файла выгрузки с сохранением файла в кэш после передачи
+    последней части. Файлы больше SHOPPING_LIST_CACHE_MAX_SIZE байт
+    не кэшируются.
+    """
+    content, size = [], 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if content is not None:
+            content.append(chunk)
+            size += len(chunk)
+            if size > settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+                content = None
+        yield chunk
+    if content is not None:
+        cache.set(key, b"".join(content), settings.SHOPPING_LIST_CACHE_TTL)
 
 
 def ingredients_export(self, request, ingredients):
-    """Экспорт списка покупок в формате *.txt файла."""
+    """
+    Экспорт списка покупок в файл формата, заданного параметром 'format'
+    (txt - по умолчанию, csv, json, pdf). Файл передается потоком по мере
+    чтения строк списка из базы данных и кэшируется до изменения списка
+    покупок. При совпадении заголовка If-None-Match с ETag возвращается
+    ответ 304 без обращения к базе данных.
+    """
     user = self.request.user
-    filename = f"{user.username}_shopping_list.txt"
-
+    export_format = request.query_params.get("format", "txt")
+    if export_format not in SHOPPING_LIST_FORMATS or (
+        export_format == "pdf" and not register_pdf_font()
+    ):
+        raise ValidationError(
+            {"format": f"Формат '{export_format}' не поддерживается."}
+        )
+    content_type, export = SHOPPING_LIST_FORMATS[export_format]
     today = date.today()
-    shopping_list = f"Список покупок пользователя: {user.username}\n\n"
-    shopping_list += f"Дата: {today:%Y-%m-%d}\n\n"
-
-    ingredient_lines = [
-        f'- {ingredient["ingredient__name"]} '
-        f'({ingredient["ingredient__measurement_unit"]}) - '
-        f'{ingredient["amount"]}'
-        for ingredient in ingredients
-    ]
-    shopping_list += "\n".join(ingredient_lines)
-    shopping_list += f"\n\nFoodgram ({today:%Y})"
-
-    response = HttpResponse(
-        shopping_list, content_type="text/plain; charset=utf-8"
-    )
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    signature = shopping_list_signature(user, export_format, today)
+    etag = f'"{signature}"'
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        response = HttpResponseNotModified()
+    else:
+        key = SHOPPING_LIST_KEY.format(signature=signature)
+        content = cache.get(key)
+        if content is None:
+            response = StreamingHttpResponse(
+                cached_export(key, export(user, ingredients, today)),
+                content_type=content_type,
+            )
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        filename = f"{user.username}_shopping_list.{export_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
     return response
 
 
@@ -1,11 +1,13 @@
 from urllib.parse import unquote
 
 from django.conf import settings
-from django.db.models import Count, Exists, OuterRef, Sum, Value
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.db.transaction import atomic
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
@@ -15,34 +17,62 @@ from rest_framework.response import Response
 from recipes.models import (
     Favorites,
     Ingredients,
-    IngredientsInRecipe,
+    IngredientsInShoppingList,
     Recipes,
+    RecipesInFeed,
     ShoppingCart,
     Tags,
 )
 from users.models import CustomUser, Follow
 
+from .cache import TAGS_VERSION, CatalogCacheMixin
 from .filters import RecipeFilter
-from .pagination import LimitPageNumberPagination
+from .pagination import (
+    ApproximateCount,
+    LimitCursorPagination,
+    LimitPageNumberPagination,
+)
 from .permissions import AuthorOrReadOnly
+from .search import INGREDIENTS_VERSION, get_ingredient_index
 from .serializers import (
+    BatchSerializer,
     CustomUserSerializer,
     FavoritesWriteSerializer,
     FollowSerializer,
     IngredientSerializer,
-    RecipeShortRepresentationSerializer,
     RecipesReadSerializer,
     RecipesWriteSerializer,
     ShoppingCartWriteSerializer,
     TagsSerializer,
 )
 from .utils import (
+    ExportContentNegotiation,
+    batch_result,
+    change_counter,
+    change_counters,
     ingredients_export,
     prohibited_method_response,
     serializer_add_delete,
+    serializer_batch_add_delete,
+    user_list_changed,
 )
 
 
+def get_batch_ids(request):
+    """Проверенный список идентификаторов из данных пакетного запроса."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data["ids"]
+
+
+def lock_user(user):
+    """
+    Блокировка записи пользователя до конца текущей транзакции: изменения
+    подписок пользователя выполняются последовательно.
+    """
+    list(CustomUser.objects.select_for_update().filter(pk=user.pk))
+
+
 class CustomUserViewSet(UserViewSet):
     """
     Представление данных модели пользователя на основе измененной модели
@@ -51,6 +81,7 @@ class CustomUserViewSet(UserViewSet):
 
     serializer_class = CustomUserSerializer
     pagination_class = LimitPageNumberPagination
+    count_class = ApproximateCount
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
     def update(self, request, *args, **kwargs):
@@ -83,24 +114,121 @@ class CustomUserViewSet(UserViewSet):
         methods=["POST", "DELETE"],
         permission_classes=(IsAuthenticated,),
     )
+    @atomic
     def subscribe(self, request, **kwargs):
         """
         Энедпоинт для добавления / удаления подписки на пользователя.
-        Доступно только авторизованным пользователям.
+        Доступно только авторизованным пользователям. Счетчик подписчиков
+        автора и лента рецептов пользователя изменяются в той же транзакции
+        (с блокировкой записи пользователя, как и в пакетном эндпоинте).
         """
         user = request.user
         author_id = self.kwargs.get("id")
         author = get_object_or_404(CustomUser, id=author_id)
+        lock_user(user)
         if request.method == "POST":
             serializer = FollowSerializer(
                 author, data=request.data, context={"request": request}
             )
             serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=user, author=author)
+            if not Follow.objects.add_many(user.id, (author.id,)):
+                raise ValidationError(
+                    detail=FollowSerializer.Meta.message,
+                    code=status.HTTP_400_BAD_REQUEST,
+                )
+            change_counter(CustomUser, author.id, "followers_count", 1)
+            RecipesInFeed.objects.backfill(user.id, (author.id,))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         get_object_or_404(Follow, user=user, author=author).delete()
+        change_counter(CustomUser, author.id, "followers_count", -1)
+        RecipesInFeed.objects.prune(user.id, (author.id,))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path="subscribe",
+        url_name="subscribe-batch",
+    )
+    @atomic
+    def subscribe_batch(self, request):
+        """
+        Эндпоинт для пакетного добавления / удаления подписок на авторов
+        из списка 'ids' в одной транзакции. Подписки создаются одним запросом
+        INSERT ... RETURNING и удаляются одним запросом, счетчики подписчиков
+        изменяются только для действительно добавленных (удаленных) подписок,
+        лента рецептов пользователя - одним запросом для всех авторов.
+        Запросы подписки пользователя выполняются последовательно (блокировка
+        записи пользователя). Возвращает результаты для каждого автора.
+        """
+        user = request.user
+        author_ids = get_batch_ids(request)
+        lock_user(user)
+        followed = set(
+            user.follower.filter(author_id__in=author_ids).values_list(
+                "author_id", flat=True
+            )
+        )
+        if request.method == "DELETE":
+            return self.unsubscribe_batch(user, author_ids, followed)
+        authors = set(
+            CustomUser.objects.filter(pk__in=author_ids).values_list(
+                "pk", flat=True
+            )
+        )
+        errors = {}
+        for author_id in author_ids:
+            if author_id not in authors:
+                errors[author_id] = (
+                    status.HTTP_404_NOT_FOUND,
+                    NotFound.default_detail,
+                )
+            elif author_id == user.id:
+                errors[author_id] = (
+                    status.HTTP_400_BAD_REQUEST,
+                    FollowSerializer.Meta.self_message,
+                )
+            elif author_id in followed:
+                errors[author_id] = (
+                    status.HTTP_400_BAD_REQUEST,
+                    FollowSerializer.Meta.message,
+                )
+        added = Follow.objects.add_many(
+            user.id,
+            [author_id for author_id in author_ids if author_id not in errors],
+        )
+        for author_id in author_ids:
+            if author_id not in errors and author_id not in added:
+                errors[author_id] = (
+                    status.HTTP_400_BAD_REQUEST,
+                    FollowSerializer.Meta.message,
+                )
+        change_counters(CustomUser, added, "followers_count", 1)
+        RecipesInFeed.objects.backfill(user.id, added)
+        results = [
+            batch_result(author_id, *errors[author_id])
+            if author_id in errors
+            else batch_result(author_id, status.HTTP_201_CREATED)
+            for author_id in author_ids
+        ]
+        return Response({"results": results})
+
+    def unsubscribe_batch(self, user, author_ids, followed):
+        """Пакетное удаление подписок пользователя на авторов."""
+        user.follower.filter(author_id__in=followed).delete()
+        change_counters(CustomUser, followed, "followers_count", -1)
+        RecipesInFeed.objects.prune(user.id, followed)
+        results = [
+            batch_result(author_id, status.HTTP_204_NO_CONTENT)
+            if author_id in followed
+            else batch_result(
+                author_id, status.HTTP_404_NOT_FOUND, NotFound.default_detail
+            )
+            for author_id in author_ids
+        ]
+        return Response({"results": results})
+
     @action(
         detail=False, methods=["GET"], permission_classes=(IsAuthenticated,)
     )
@@ -110,13 +238,25 @@ class CustomUserViewSet(UserViewSet):
         пользователь. Сериализатор дополнительно отображает список рецептов
         пользователей и их общее количество для каждого автора в списке.
         Количество рецептов в эндпоинте может быть ограничено запросом
-        'recipes_limit=<integer>'.
+        'recipes_limit=<integer>'. Рецепты всех авторов страницы выбираются
+        одним запросом с ограничением количества для каждого автора (оконная
+        функция ROW_NUMBER), количество рецептов хранится в модели
+        пользователя.
         """
+        recipes = Recipes.objects.only(
+            "id", "name", "image", "cooking_time", "author"
+        )
+        recipes_limit = request.query_params.get("recipes_limit")
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
         queryset = (
             CustomUser.objects.filter(following__user=request.user)
-            .prefetch_related("recipes")
+            .prefetch_related(
+                Prefetch(
+                    "recipes", queryset=recipes, to_attr="subscription_recipes"
+                )
+            )
             .annotate(is_subscribed=Value(True))
-            .annotate(recipes_count=Count("recipes"))
             .order_by("-id")
         )
         serializer = FollowSerializer(
@@ -124,65 +264,93 @@ class CustomUserViewSet(UserViewSet):
             many=True,
             context={"request": request},
         )
-        serialized_data = serializer.data
-
-        recipes_limit = request.query_params.get("recipes_limit")
-        if recipes_limit:
-            recipes_limit = int(recipes_limit)
-            for data in serialized_data:
-                user = get_object_or_404(CustomUser, id=data["id"])
-                recipe_serializer = RecipeShortRepresentationSerializer(
-                    user.recipes.all()[:recipes_limit],
-                    many=True,
-                    read_only=True,
-                )
-                data["recipes"] = recipe_serializer.data
-
-        return self.get_paginated_response(serialized_data)
+        return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Представление данных модели тегов. Для внесения изменений в
     модель данных, воспользуйтесь панелью администратора.
     """
 
+    catalog_version = TAGS_VERSION
     queryset = Tags.objects.all()
     serializer_class = TagsSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """Представление данных модели ингредиентов."""
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Представление данных модели ингредиентов. Полный список ингредиентов
+    отображается с курсорной паджинацией, результаты поиска по названию -
+    списком, размер которого задается параметром 'limit' (не более
+    INGREDIENT_SEARCH_LIMIT).
+    """
 
+    catalog_version = INGREDIENTS_VERSION
+    catalog_params = ("cursor", "limit")
     queryset = Ingredients.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
-    pagination_class = None
+    pagination_class = LimitCursorPagination
 
     def get_queryset(self):
         """
         Переопределение запроса набора объектов ингредиентов в соответствии
-        с параметрами запроса.
+        с параметрами запроса. Поиск по названию выполняется по процессному
+        индексу ингредиентов без обращения к базе данных либо (при
+        INGREDIENT_SEARCH_IN_MEMORY = False) одним ранжированным запросом.
+        Параметр 'fuzzy=true' включает нечеткий поиск с допуском опечаток
+        (с тем же выбором между индексом и запросом к базе данных).
         """
         name = self.request.query_params.get("name")
         queryset = super().get_queryset()
         if name:
-            if name.startswith("%"):
-                name = unquote(name)
-            else:
-                name = name.translate(settings.INCORRECT_LAYOUT)
-            name = name.lower()
-            start_queryset = list(queryset.filter(name__istartswith=name))
-            ingredients_set = set(start_queryset)
-            cont_queryset = queryset.filter(name__icontains=name)
-            start_queryset.extend(
-                [ing for ing in cont_queryset if ing not in ingredients_set]
-            )
-            queryset = start_queryset
+            queryset = self.search(queryset, name)
+            queryset = queryset[:self.get_search_limit()]
         return queryset
 
+    def paginate_queryset(self, queryset):
+        """Результаты поиска по названию не паджинируются."""
+        if self.request.query_params.get("name"):
+            return None
+        return super().paginate_queryset(queryset)
+
+    def get_search_limit(self):
+        """
+        Количество результатов поиска из параметра 'limit'. Некорректные
+        и превышающие INGREDIENT_SEARCH_LIMIT значения заменяются на
+        INGREDIENT_SEARCH_LIMIT.
+        """
+        try:
+            limit = int(self.request.query_params.get("limit"))
+        except (TypeError, ValueError):
+            return settings.INGREDIENT_SEARCH_LIMIT
+        if 0 < limit < settings.INGREDIENT_SEARCH_LIMIT:
+            return limit
+        return settings.INGREDIENT_SEARCH_LIMIT
+
+    def search(self, queryset, name):
+        """
+        Поиск ингредиентов по названию с исправлением раскладки клавиатуры.
+        В режиме нечеткого поиска исходный запрос и запрос в исправленной
+        раскладке проверяются одновременно.
+        """
+        fuzzy = self.request.query_params.get("fuzzy") in ("1", "true")
+        if name.startswith("%"):
+            name = unquote(name)
+        elif not fuzzy:
+            name = name.translate(settings.INCORRECT_LAYOUT)
+        if fuzzy:
+            variants = (name, name.translate(settings.INCORRECT_LAYOUT))
+            if settings.INGREDIENT_SEARCH_IN_MEMORY:
+                return get_ingredient_index().fuzzy_search(variants)
+            return queryset.fuzzy_search(variants)
+        if settings.INGREDIENT_SEARCH_IN_MEMORY:
+            return get_ingredient_index().search(name)
+        return queryset.search(name)
+
 
 class RecipesViewSet(viewsets.ModelViewSet):
     """
@@ -193,6 +361,7 @@ class RecipesViewSet(viewsets.ModelViewSet):
     permission_classes = (AuthorOrReadOnly,)
     filterset_class = RecipeFilter
     pagination_class = LimitPageNumberPagination
+    count_class = ApproximateCount
 
     def get_queryset(self):
         """
@@ -200,20 +369,37 @@ class RecipesViewSet(viewsets.ModelViewSet):
         в избранное.
         Добавление поля is_in_shopping_cart для определения добавления рецепта
         в список покупок.
+        Добавление поля author_is_subscribed для определения наличия подписки
+        на автора рецепта.
+        Автор, теги и ингредиенты рецептов загружаются сериализатором только
+        для рецептов, отображений которых нет в кэше (количество запросов
+        не зависит от размера страницы).
         """
+        user = self.request.user
         return Recipes.objects.annotate(
             is_favorited=Exists(
-                self.request.user.favorites.filter(recipe=OuterRef("pk"))
+                user.favorites.filter(recipe=OuterRef("pk"))
             )
-            if self.request.user.is_authenticated
+            if user.is_authenticated
             else Value(False),
             is_in_shopping_cart=Exists(
-                self.request.user.shopping_list.filter(recipe=OuterRef("pk"))
+                user.shopping_list.filter(recipe=OuterRef("pk"))
             )
-            if self.request.user.is_authenticated
+            if user.is_authenticated
+            else Value(False),
+            author_is_subscribed=Exists(
+                user.follower.filter(author=OuterRef("author"))
+            )
+            if user.is_authenticated
             else Value(False),
         )
 
+    @atomic
+    def perform_destroy(self, instance):
+        """Удаление рецепта с уменьшением счетчика рецептов автора."""
+        instance.delete()
+        change_counter(CustomUser, instance.author_id, "recipes_count", -1)
+
     def get_serializer_class(self):
         """
         Изменение типа вызываемого сериализатора, в зависимости от метода
@@ -232,6 +418,26 @@ class RecipesViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    @action(
+        detail=False, methods=["GET"], permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """
+        Эндпоинт ленты рецептов авторов, на которых подписан пользователь,
+        с курсорной паджинацией (сначала новые). Рецепты страницы выбираются
+        по ленте пользователя (RecipesInFeed) и, для авторов с большим
+        числом подписчиков, по подпискам - объединением двух подзапросов
+        с ограничением количества начиная с позиции курсора.
+        """
+        paginator = LimitCursorPagination()
+        recipe_ids = RecipesInFeed.objects.page_recipe_ids(
+            request.user, *paginator.get_page_window(request)
+        )
+        queryset = self.get_queryset().filter(pk__in=recipe_ids)
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=["POST", "DELETE"],
@@ -255,20 +461,98 @@ class RecipesViewSet(viewsets.ModelViewSet):
         )
 
     @action(
-        detail=False, methods=["GET"], permission_classes=(IsAuthenticated,)
+        detail=False,
+        methods=["POST", "DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path="favorite",
+        url_name="favorite-batch",
+    )
+    def favorite_batch(self, request):
+        """
+        Эндпоинт для пакетного добавления / удаления рецептов из списка 'ids'
+        в список избранного.
+        """
+        return serializer_batch_add_delete(
+            FavoritesWriteSerializer,
+            Favorites,
+            request,
+            get_batch_ids(request),
+        )
+
+    @action(
+        detail=False,
+        methods=["POST", "DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path="shopping_cart",
+        url_name="shopping-cart-batch",
+    )
+    def shopping_cart_batch(self, request):
+        """
+        Эндпоинт для пакетного добавления / удаления рецептов из списка 'ids'
+        в корзину.
+        """
+        return serializer_batch_add_delete(
+            ShoppingCartWriteSerializer,
+            ShoppingCart,
+            request,
+            get_batch_ids(request),
+        )
+
+    @action(
+        detail=False,
+        methods=["POST"],
+        permission_classes=(IsAuthenticated,),
+        url_path="shopping_cart/from_favorites",
+    )
+    @atomic
+    def shopping_cart_from_favorites(self, request):
+        """
+        Эндпоинт для добавления всех избранных рецептов в корзину одним
+        запросом INSERT ... SELECT. В ответе - результаты для добавленных
+        рецептов (рецепты, уже находящиеся в корзине, пропускаются).
+        """
+        added = ShoppingCart.objects.add_from(request.user.id, Favorites)
+        user_list_changed(ShoppingCart, request.user.id, added, 1)
+        return Response(
+            {
+                "results": [
+                    batch_result(recipe_id, status.HTTP_201_CREATED)
+                    for recipe_id in sorted(added)
+                ]
+            }
+        )
+
+    @action(
+        detail=False,
+        methods=["DELETE"],
+        permission_classes=(IsAuthenticated,),
+        url_path="shopping_cart/all",
+    )
+    def clear_shopping_cart(self, request):
+        """Эндпоинт для удаления всех рецептов из корзины."""
+        return serializer_batch_add_delete(
+            ShoppingCartWriteSerializer, ShoppingCart, request, None
+        )
+
+    @action(
+        detail=False,
+        methods=["GET"],
+        permission_classes=(IsAuthenticated,),
+        content_negotiation_class=ExportContentNegotiation,
     )
     def download_shopping_cart(self, request):
         """
         Эндпоинт для выгрузки списка ингредиентов всех рецептов, находящихся
-        в корзине (списке покупок) пользователей. Одинаковые ингредиенты
-        суммируются по количеству.
+        в корзине (списке покупок) пользователей. Количество одинаковых
+        ингредиентов уже просуммировано в списке покупок пользователя
+        (IngredientsInShoppingList). Формат файла задается параметром 'format'
+        (txt, csv, json, pdf).
         """
         ingredients = (
-            IngredientsInRecipe.objects.filter(
-                recipe__shopping_list__user=self.request.user
+            IngredientsInShoppingList.objects.filter(user=self.request.user)
+            .values(
+                "ingredient__name", "ingredient__measurement_unit", "amount"
             )
-            .values("ingredient__name", "ingredient__measurement_unit")
             .order_by("ingredient__name")
-            .annotate(amount=Sum("amount"))
         )
         return ingredients_export(self, request, ingredients)
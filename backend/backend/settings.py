@@ -95,6 +95,9 @@ REST_FRAMEWORK = {
         "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 6,
 }
+MAX_PAGE_SIZE = 100
+APPROXIMATE_COUNT_TTL = 60
+BATCH_MAX_SIZE = 100
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -184,6 +187,64 @@ DJOSER = {
     },
 }
 
+# Cache shared by all processes: version stamps (see api.cache), cached
+# catalogs, recipe fragments and shopping list exports. Without REDIS_URL
+# (local development) the cache is local to the process, so stamps bumped by
+# management commands are not seen by the running server.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        }
+    }
+
+# Catalog cache: rendered tag and ingredient lists of the current version
+# expire after a day, so entries of replaced versions do not pile up
+CATALOG_CACHE_TTL = 60 * 60 * 24
+
+# Recipe fragment cache: a fragment rendered from data read before a concurrent
+# update may be cached after the update's invalidation, so it expires in 5 min
+RECIPE_FRAGMENT_CACHE_TTL = 60 * 5
+
+# Ingredient search: in-memory index (default) or single ranked SQL query
+INGREDIENT_SEARCH_IN_MEMORY = (
+    os.getenv("INGREDIENT_SEARCH_IN_MEMORY", default="True") == "True"
+)
+INGREDIENT_SEARCH_LIMIT = 100
+INGREDIENT_FUZZY_MAX_DISTANCE = 2
+
+# Shopping list PDF export: TrueType font with cyrillic glyphs
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    "SHOPPING_LIST_PDF_FONT",
+    default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+# Shopping list export cache: files up to 1 MB are kept for a day
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_CACHE_TTL = 60 * 60 * 24
+
+# Subscription feed: recipes of authors with more followers than
+# FEED_FANOUT_MAX_FOLLOWERS are read from the author instead of timelines
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv("FEED_FANOUT_MAX_FOLLOWERS", default=1000)
+)
+FEED_BACKFILL_SIZE = 100
+
+# Recipe popularity score (manage.py popularity): favorites and cart adds
+# decay with a half-life of POPULARITY_HALF_LIFE_DAYS
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_WINDOW_DAYS = 60
+POPULARITY_CART_WEIGHT = 0.5
+
 INCORRECT_LAYOUT = str.maketrans(
     "qwertyuiop[]asdfghjkl;'zxcvbnm,./", "йцукенгшщзхъфывапролджэячсмитьбю."
 )
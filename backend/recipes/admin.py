@@ -1,4 +1,10 @@
+from collections import Counter
+
 from django.contrib import admin
+from django.db.transaction import atomic
+
+from api.utils import change_counter, change_counters
+from users.models import CustomUser
 
 from .models import Favorites, Ingredients, Recipes, ShoppingCart, Tags
 
@@ -64,10 +70,35 @@ class RecipesAdmin(admin.ModelAdmin):
 
     inlines = (IngredientsInline,)
 
-    @admin.display(description="В избранном")
-    def favorites_count(self, obj):
+    def save_model(self, request, obj, form, change):
+        """
+        Сохранение рецепта с изменением счетчика рецептов автора (при смене
+        автора - счетчиков прежнего и нового авторов).
+        """
+        super().save_model(request, obj, form, change)
+        if change and "author" in form.changed_data:
+            change_counter(
+                CustomUser, form.initial["author"], "recipes_count", -1
+            )
+        if not change or "author" in form.changed_data:
+            change_counter(CustomUser, obj.author_id, "recipes_count", 1)
+
+    def delete_model(self, request, obj):
+        """Удаление рецепта с уменьшением счетчика рецептов автора."""
+        super().delete_model(request, obj)
+        change_counter(CustomUser, obj.author_id, "recipes_count", -1)
+
+    @atomic
+    def delete_queryset(self, request, queryset):
         """
-        Отображение количества раз, когда рецепт был добавлен кем-либо в список
-        избранного.
+        Удаление выбранных рецептов с уменьшением счетчиков рецептов их
+        авторов: одним запросом для авторов с одинаковым числом удаленных
+        рецептов.
         """
-        return obj.favorites.count()
+        authors = Counter(queryset.values_list("author_id", flat=True))
+        super().delete_queryset(request, queryset)
+        deleted = {}
+        for author_id, count in authors.items():
+            deleted.setdefault(count, []).append(author_id)
+        for count, author_ids in deleted.items():
+            change_counters(CustomUser, author_ids, "recipes_count", -count)
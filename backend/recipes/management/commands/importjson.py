@@ -3,6 +3,8 @@ import json
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
+from api.cache import bump_version
+from api.search import INGREDIENTS_VERSION
 from recipes.models import Ingredients
 
 JSON_FILE_PATH = settings.DATABASE_FILE_UPLOAD_FOLDER / "ingredients.json"
@@ -29,6 +31,7 @@ class Command(BaseCommand):
                 Ingredients.objects.bulk_create(
                     ingredients, ignore_conflicts=True
                 )
+                bump_version(INGREDIENTS_VERSION)
 
         except json.JSONDecodeError as e:
             raise CommandError(
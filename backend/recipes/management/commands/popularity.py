@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import Favorites, Recipes, ShoppingCart
+
+SECONDS_IN_DAY = 24 * 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Расчет рейтинга популярности рецептов (сортировка ordering=popular) "
+        "по добавлениям в избранное и корзину с экспоненциальным затуханием "
+        "по времени. Команду следует запускать периодически (например, "
+        "ежечасно по расписанию cron)."
+    )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        scores = {}
+        for model, weight in (
+            (Favorites, 1),
+            (ShoppingCart, settings.POPULARITY_CART_WEIGHT),
+        ):
+            self.add_scores(scores, model, weight, now)
+        with transaction.atomic():
+            Recipes.objects.filter(popularity_score__gt=0).update(
+                popularity_score=0
+            )
+            Recipes.objects.bulk_update(
+                (
+                    Recipes(pk=recipe_id, popularity_score=score)
+                    for recipe_id, score in scores.items()
+                ),
+                ("popularity_score",),
+                batch_size=1000,
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Рейтинг популярности рассчитан для {len(scores)} рецептов."
+            )
+        )
+
+    def add_scores(self, scores, model, weight, now):
+        """
+        Добавление в 'scores' вклада событий модели 'model' за последние
+        POPULARITY_WINDOW_DAYS дней. События группируются базой данных по
+        рецепту и часу добавления, вес группы - количество событий,
+        умноженное на 'weight' и 2 ** (-возраст / период полураспада).
+        """
+        half_life = settings.POPULARITY_HALF_LIFE_DAYS * SECONDS_IN_DAY
+        events = (
+            model.objects.filter(
+                created__gte=now
+                - timedelta(days=settings.POPULARITY_WINDOW_DAYS)
+            )
+            .annotate(hour=TruncHour("created"))
+            .values_list("recipe_id", "hour")
+            .order_by()
+            .annotate(count=Count("pk"))
+        )
+        for recipe_id, hour, count in events.iterator():
+            age = (now - hour).total_seconds()
+            scores[recipe_id] = scores.get(recipe_id, 0) + (
+                weight * count * 2 ** (-age / half_life)
+            )
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorites, Recipes
+from users.models import CustomUser, Follow
+
+COUNTERS = (
+    (CustomUser, "recipes_count", Recipes, "author"),
+    (CustomUser, "followers_count", Follow, "author"),
+    (Recipes, "favorites_count", Favorites, "recipe"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка счетчиков рецептов и подписчиков пользователей и добавлений "
+        "рецептов в избранное с фактическим количеством записей и "
+        "исправление расхождений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только вывести количество расхождений, не исправляя их.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for model, field, related_model, related_field in COUNTERS:
+            actual = Coalesce(
+                Subquery(
+                    related_model.objects.filter(
+                        **{related_field: OuterRef("pk")}
+                    )
+                    .order_by()
+                    .values(related_field)
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                0,
+            )
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{field: F("actual")}
+            )
+            count = drifted.count()
+            if count and not options["dry_run"]:
+                model.objects.filter(
+                    pk__in=drifted.values("pk")
+                ).update(**{field: actual})
+            self.stdout.write(
+                f"{model._meta.object_name}.{field}: расхождений {count}"
+            )
+        self.stdout.write(self.style.SUCCESS("Сверка счетчиков завершена."))
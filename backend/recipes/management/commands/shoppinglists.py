@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import SHOPPING_LISTS_VERSION, bump_version
+from recipes.models import IngredientsInShoppingList
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестроение списков покупок пользователей по корзинам и составу "
+        "рецептов либо их проверка (--verify)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только проверить списки покупок, не изменяя их.",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            self.verify()
+            return
+        IngredientsInShoppingList.objects.rebuild()
+        bump_version(SHOPPING_LISTS_VERSION)
+        self.stdout.write(self.style.SUCCESS("Списки покупок перестроены."))
+
+    def verify(self):
+        """
+        Сравнение списков покупок с вычисленными по корзинам пользователей.
+        При расхождениях выводится их перечень и команда завершается ошибкой.
+        """
+        expected = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                IngredientsInShoppingList.objects.expected().iterator()
+            )
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                IngredientsInShoppingList.objects.values_list(
+                    "user_id", "ingredient_id", "amount"
+                ).iterator()
+            )
+        }
+        differences = sorted(
+            (key, stored.get(key), expected.get(key))
+            for key in expected.keys() | stored.keys()
+            if stored.get(key) != expected.get(key)
+        )
+        for (user_id, ingredient_id), actual, amount in differences:
+            self.stdout.write(
+                f"Пользователь {user_id}, ингредиент {ingredient_id}: "
+                f"{actual} вместо {amount}"
+            )
+        if differences:
+            raise CommandError(
+                f"Расхождений в списках покупок: {len(differences)}. "
+                "Выполните команду без параметра --verify для перестроения."
+            )
+        self.stdout.write(self.style.SUCCESS("Списки покупок в порядке."))
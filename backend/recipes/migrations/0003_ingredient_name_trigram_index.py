@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    Создание триграммного GIN индекса по названию ингредиента. Выражение
+    индекса совпадает с условием 'name__icontains' в PostgreSQL. Для других
+    СУБД (например, SQLite) миграция ничего не выполняет.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS ingredient_name_trigram_index "
+        "ON recipes_ingredients "
+        "USING gin (UPPER(name::text) gin_trgm_ops);"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "DROP INDEX IF EXISTS ingredient_name_trigram_index;"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
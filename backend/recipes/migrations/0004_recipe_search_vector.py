@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+def create_search_vector(apps, schema_editor):
+    """
+    Добавление хранимого генерируемого столбца tsvector (конфигурация
+    'russian', название рецепта имеет больший вес, чем описание) и GIN
+    индекса по нему. Столбец не описан в модели и используется только
+    фильтром полнотекстового поиска. Для других СУБД (например, SQLite)
+    миграция ничего не выполняет.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "ALTER TABLE recipes_recipes ADD COLUMN IF NOT EXISTS search_vector "
+        "tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+        ") STORED;"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS recipe_search_vector_index "
+        "ON recipes_recipes USING gin (search_vector);"
+    )
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS recipe_search_vector_index;")
+    schema_editor.execute(
+        "ALTER TABLE recipes_recipes DROP COLUMN IF EXISTS search_vector;"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0003_ingredient_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
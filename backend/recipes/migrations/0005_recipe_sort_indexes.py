@@ -0,0 +1,31 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0004_recipe_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                fields=["pub_date", "id"], name="recipe_pub_date_index"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                fields=["cooking_time", "id"], name="recipe_cooking_time_index"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                fields=["author", "cooking_time", "id"],
+                name="recipe_author_time_index",
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    """Заполнение списков покупок по текущим корзинам пользователей."""
+    IngredientsInRecipe = apps.get_model("recipes", "IngredientsInRecipe")
+    IngredientsInShoppingList = apps.get_model(
+        "recipes", "IngredientsInShoppingList"
+    )
+    amounts = (
+        IngredientsInRecipe.objects.filter(recipe__shopping_list__isnull=False)
+        .values_list("recipe__shopping_list__user", "ingredient")
+        .order_by("recipe__shopping_list__user", "ingredient")
+        .annotate(total=Sum("amount"))
+    )
+    IngredientsInShoppingList.objects.bulk_create(
+        (
+            IngredientsInShoppingList(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for user_id, ingredient_id, amount in amounts.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0005_recipe_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngredientsInShoppingList",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.PositiveIntegerField(verbose_name="Количество"),
+                ),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="recipes.ingredients",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ингредиент в списке покупок",
+                "verbose_name_plural": "Ингредиенты в списке покупок",
+                "default_related_name": "shopping_list_ingredients",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ingredientsinshoppinglist",
+            constraint=models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="unique_shopping_list_ingredient",
+            ),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field):
+    """Подзапрос количества объектов 'model', ссылающихся полем 'field'."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    """Заполнение счетчиков рецептов, подписчиков и добавлений в избранное."""
+    CustomUser = apps.get_model("users", "CustomUser")
+    Follow = apps.get_model("users", "Follow")
+    Recipes = apps.get_model("recipes", "Recipes")
+    Favorites = apps.get_model("recipes", "Favorites")
+    CustomUser.objects.update(
+        recipes_count=count_of(Recipes, "author"),
+        followers_count=count_of(Follow, "author"),
+    )
+    Recipes.objects.update(favorites_count=count_of(Favorites, "recipe"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0006_shopping_list_ingredients"),
+        ("users", "0002_user_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipes",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="В избранном"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                fields=["favorites_count", "id"],
+                name="recipe_favorites_count_index",
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
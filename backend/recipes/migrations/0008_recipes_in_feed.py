@@ -0,0 +1,92 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    """Заполнение лент рецептов пользователей по текущим подпискам."""
+    Follow = apps.get_model("users", "Follow")
+    Recipes = apps.get_model("recipes", "Recipes")
+    RecipesInFeed = apps.get_model("recipes", "RecipesInFeed")
+    follows = Follow.objects.values_list("user_id", "author_id")
+    for user_id, author_id in follows:
+        recipe_ids = (
+            Recipes.objects.filter(author_id=author_id)
+            .order_by("-id")
+            .values_list("id", flat=True)[: settings.FEED_BACKFILL_SIZE]
+        )
+        RecipesInFeed.objects.bulk_create(
+            RecipesInFeed(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id
+            )
+            for recipe_id in recipe_ids
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0007_recipe_favorites_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipesInFeed",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Автор рецепта",
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="recipes.recipes",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Рецепт в ленте",
+                "verbose_name_plural": "Рецепты в ленте",
+                "default_related_name": "feed_recipes",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "author"],
+                        name="feed_user_author_index",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="recipesinfeed",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_feed_recipe"
+            ),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0008_recipes_in_feed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="favorites",
+            name="created",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата добавления",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="recipes",
+            name="popularity_score",
+            field=models.FloatField(
+                default=0, editable=False, verbose_name="Рейтинг популярности"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shoppingcart",
+            name="created",
+            field=models.DateTimeField(
+                auto_now_add=True,
+                db_index=True,
+                default=django.utils.timezone.now,
+                verbose_name="Дата добавления",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                fields=["popularity_score", "id"],
+                name="recipe_popularity_score_index",
+            ),
+        ),
+    ]
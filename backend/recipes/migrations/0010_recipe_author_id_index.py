@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0009_recipe_popularity_score"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipes",
+            index=models.Index(
+                fields=["author", "id"], name="recipe_author_id_index"
+            ),
+        ),
+    ]
@@ -1,8 +1,12 @@
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import F, Sum, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.utils import timezone
 
-from users.models import CustomUser
+from users.models import CustomUser, Follow, ReturningQuerySet
 
 from .validators import hex_validation
 
@@ -59,12 +63,74 @@ class Tags(BaseNameModel):
         return f"{self.name}"
 
 
+class IngredientsQuerySet(models.QuerySet):
+    """Набор запросов модели ингредиентов."""
+
+    def search(self, name):
+        """
+        Поиск ингредиентов одним запросом: совпадения по началу названия
+        ранжируются выше совпадений по вхождению подстроки. В PostgreSQL
+        условие поиска обслуживается триграммным GIN индексом по названию.
+        """
+        return (
+            self.filter(name__icontains=name)
+            .annotate(
+                search_rank=models.Case(
+                    models.When(name__istartswith=name, then=models.Value(0)),
+                    default=models.Value(1),
+                )
+            )
+            .order_by("search_rank", *self.model._meta.ordering)
+        )
+
+    def fuzzy_search(self, variants):
+        """
+        Нечеткий поиск ингредиентов одним запросом по любому из вариантов
+        запроса (например, в исходной и в исправленной раскладке). В
+        PostgreSQL названия отбираются оператором pg_trgm '%>' (в названии
+        есть слово, похожее на вариант запроса не меньше порога
+        pg_trgm.word_similarity_threshold) по триграммному GIN индексу и
+        упорядочиваются по убыванию сходства. Для других СУБД выполняется
+        поиск по вхождению подстроки без допуска опечаток.
+        """
+        variants = list(dict.fromkeys(variants))
+        if connections[self.db].vendor != "postgresql":
+            condition = models.Q()
+            for variant in variants:
+                condition |= models.Q(name__icontains=variant)
+            return self.filter(condition)
+        column = f'UPPER("{self.model._meta.db_table}"."name")'
+        condition = " OR ".join(
+            [f"{column} %%> UPPER(%s)"] * len(variants)
+        )
+        rank = ", ".join(
+            [f"word_similarity(UPPER(%s), {column})"] * len(variants)
+        )
+        return (
+            self.filter(
+                RawSQL(
+                    condition, variants, output_field=models.BooleanField()
+                )
+            )
+            .annotate(
+                search_rank=RawSQL(
+                    f"GREATEST({rank})",
+                    variants,
+                    output_field=models.FloatField(),
+                )
+            )
+            .order_by("-search_rank", *self.model._meta.ordering)
+        )
+
+
 class Ingredients(BaseNameModel):
     """
     Модель названий ингредиентов и соответствующим им единицам измерения.
     Единица измерения выбираются из пресета значений класса MeasurementUnit.
     """
 
+    objects = IngredientsQuerySet.as_manager()
+
     measurement_unit = models.CharField(
         verbose_name="Единица измерения",
         help_text="Введите единицу измерения ингредиента.",
@@ -117,6 +183,12 @@ class Recipes(BaseNameModel):
         help_text="Введите время приготовления блюда в минутах",
         validators=[MinValueValidator(1, settings.LESS_THAN_ONE)],
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном", default=0, editable=False
+    )
+    popularity_score = models.FloatField(
+        verbose_name="Рейтинг популярности", default=0, editable=False
+    )
 
     def __str__(self):
         return f"{self.name}"
@@ -125,6 +197,29 @@ class Recipes(BaseNameModel):
         ordering = ("-id",)
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["pub_date", "id"], name="recipe_pub_date_index"
+            ),
+            models.Index(
+                fields=["cooking_time", "id"], name="recipe_cooking_time_index"
+            ),
+            models.Index(
+                fields=["author", "cooking_time", "id"],
+                name="recipe_author_time_index",
+            ),
+            models.Index(
+                fields=["author", "id"], name="recipe_author_id_index"
+            ),
+            models.Index(
+                fields=["favorites_count", "id"],
+                name="recipe_favorites_count_index",
+            ),
+            models.Index(
+                fields=["popularity_score", "id"],
+                name="recipe_popularity_score_index",
+            ),
+        ]
         constraints = (
             models.UniqueConstraint(
                 fields=("name", "author"),
@@ -172,6 +267,136 @@ class IngredientsInRecipe(models.Model):
         ]
 
 
+class FavoritesAndShoppingQuerySet(ReturningQuerySet):
+    ADD_SQL = (
+        "INSERT INTO {table} ({user}, {recipe}, {created}) "
+        "SELECT %s, {pk}, %s FROM {recipes} WHERE {pk} IN ({ids}) "
+        "ON CONFLICT DO NOTHING RETURNING {recipe}"
+    )
+    ADD_FROM_SQL = (
+        "INSERT INTO {table} ({user}, {recipe}, {created}) "
+        "SELECT {user}, {recipe}, %s FROM {source} WHERE {user} = %s "
+        "ON CONFLICT DO NOTHING RETURNING {recipe}"
+    )
+    ADD_AND_FETCH_SQL = (
+        "WITH inserted AS (" + ADD_SQL + ") "
+        "SELECT {columns}, EXISTS (SELECT 1 FROM inserted) "
+        "FROM {recipes} WHERE {pk} = %s"
+    )
+    REMOVE_SQL = (
+        "DELETE FROM {table} WHERE {user} = %s AND {recipe} IN ({ids}) "
+        "RETURNING {recipe}"
+    )
+    REMOVE_ALL_SQL = "DELETE FROM {table} WHERE {user} = %s RETURNING {recipe}"
+
+    def sql_names(self):
+        opts = self.model._meta
+        return {
+            **super().sql_names(),
+            "user": opts.get_field("user").column,
+            "recipe": opts.get_field("recipe").column,
+            "created": opts.get_field("created").column,
+            "recipes": Recipes._meta.db_table,
+            "pk": Recipes._meta.pk.column,
+        }
+
+    def created_param(self):
+        """Значение столбца 'created' добавляемых записей."""
+        return connections[self.db].ops.adapt_datetimefield_value(
+            timezone.now()
+        )
+
+    def insert_params(self, user_id, recipe_ids):
+        """Параметры запроса ADD_SQL."""
+        return [user_id, self.created_param(), *recipe_ids]
+
+    def add(self, user_id, recipe_id, fields):
+        """
+        Добавление рецепта пользователю запросом INSERT ... ON CONFLICT DO
+        NOTHING RETURNING без предварительной проверки наличия записи. В
+        PostgreSQL поля 'fields' рецепта выбираются тем же запросом (вставка
+        в подзапросе WITH), в других СУБД - вторым запросом.
+        Возвращает пару (рецепт либо None, если рецепта не существует;
+        признак добавления записи).
+        """
+        connection = connections[self.db]
+        params = self.insert_params(user_id, (recipe_id,))
+        if connection.vendor == "postgresql":
+            columns = [
+                field
+                for field in Recipes._meta.concrete_fields
+                if field.attname in fields
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    self.format_sql(self.ADD_AND_FETCH_SQL, columns),
+                    params + [recipe_id],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                return None, False
+            recipe = Recipes.from_db(
+                self.db, [field.attname for field in columns], row[:-1]
+            )
+            return recipe, row[-1]
+        added = self.add_many(user_id, (recipe_id,))
+        recipe = (
+            Recipes.objects.using(self.db)
+            .only(*fields)
+            .filter(pk=recipe_id)
+            .first()
+        )
+        return recipe, bool(added)
+
+    def add_many(self, user_id, recipe_ids):
+        """
+        Добавление рецептов пользователю одним запросом INSERT ... ON
+        CONFLICT DO NOTHING RETURNING. Несуществующие и уже добавленные
+        рецепты пропускаются. Возвращает идентификаторы добавленных рецептов.
+        """
+        if not recipe_ids:
+            return set()
+        return self.execute(
+            self.ADD_SQL,
+            self.insert_params(user_id, recipe_ids),
+            ids=len(recipe_ids),
+        )
+
+    def add_from(self, user_id, model):
+        """
+        Добавление пользователю всех его рецептов модели 'model' (например,
+        избранных рецептов в корзину) одним запросом INSERT ... SELECT ...
+        ON CONFLICT DO NOTHING RETURNING. Уже добавленные рецепты
+        пропускаются. Возвращает идентификаторы добавленных рецептов.
+        """
+        return self.execute(
+            self.ADD_FROM_SQL,
+            [self.created_param(), user_id],
+            source=model._meta.db_table,
+        )
+
+    def remove(self, user_id, recipe_id):
+        """
+        Удаление рецепта у пользователя запросом DELETE ... RETURNING.
+        Возвращает признак удаления записи.
+        """
+        return bool(self.remove_many(user_id, (recipe_id,)))
+
+    def remove_many(self, user_id, recipe_ids=None):
+        """
+        Удаление рецептов 'recipe_ids' (всех рецептов, если не указаны)
+        у пользователя одним запросом DELETE ... RETURNING. Возвращает
+        идентификаторы удаленных рецептов.
+        """
+        if recipe_ids is None:
+            return self.execute(self.REMOVE_ALL_SQL, [user_id])
+        if not recipe_ids:
+            return set()
+        return self.execute(
+            self.REMOVE_SQL, [user_id, *recipe_ids], ids=len(recipe_ids)
+        )
+
+
 class FavoritesAndShopping(models.Model):
     """
     Абстрактная модель для формирования наследуемых моделей Favorites и
@@ -184,6 +409,11 @@ class FavoritesAndShopping(models.Model):
     recipe = models.ForeignKey(
         Recipes, verbose_name="Рецепт", on_delete=models.CASCADE
     )
+    created = models.DateTimeField(
+        verbose_name="Дата добавления", auto_now_add=True, db_index=True
+    )
+
+    objects = FavoritesAndShoppingQuerySet.as_manager()
 
     class Meta:
         abstract = True
@@ -225,3 +455,351 @@ class ShoppingCart(FavoritesAndShopping):
                 fields=["user", "recipe"], name="unique_shopping"
             )
         ]
+
+
+class IngredientsInShoppingListQuerySet(models.QuerySet):
+    def apply(self, amounts):
+        """
+        Изменение количества ингредиентов в списках покупок пользователей.
+        'amounts' - словарь {(идентификатор пользователя, идентификатор
+        ингредиента): изменение количества}. Записи с нулевым количеством
+        удаляются. Изменения списков покупок одного пользователя выполняются
+        последовательно (блокировка записей пользователей в транзакции).
+        Возвращает идентификаторы пользователей, списки которых изменились.
+        """
+        amounts = {key: amount for key, amount in amounts.items() if amount}
+        if not amounts:
+            return []
+        user_ids = sorted({user_id for user_id, _ in amounts})
+        ingredient_ids = {ingredient_id for _, ingredient_id in amounts}
+        with transaction.atomic():
+            list(
+                CustomUser.objects.select_for_update()
+                .filter(pk__in=user_ids)
+                .order_by("pk")
+                .values_list("pk", flat=True)
+            )
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.filter(
+                    user_id__in=user_ids,
+                    ingredient_id__in=ingredient_ids,
+                )
+            }
+            created, updated, deleted = [], [], []
+            for (user_id, ingredient_id), amount in amounts.items():
+                item = items.get((user_id, ingredient_id))
+                if item is None:
+                    created.append(
+                        self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=amount,
+                        )
+                    )
+                    continue
+                item.amount += amount
+                if item.amount > 0:
+                    updated.append(item)
+                else:
+                    deleted.append(item.pk)
+            self.bulk_create(created)
+            self.bulk_update(updated, ("amount",))
+            self.filter(pk__in=deleted).delete()
+        return user_ids
+
+    def lock_recipes(self, recipe_ids, for_change=False):
+        """
+        Блокировка рецептов до конца текущей транзакции: при изменении
+        состава рецептов ('for_change', FOR UPDATE) и при добавлении /
+        удалении рецептов в корзину (FOR NO KEY UPDATE). Блокировки этих
+        операций несовместимы, поэтому изменение состава видит все
+        зафиксированные изменения корзин, а изменение корзины читает уже
+        сохраненный состав рецепта.
+        """
+        list(
+            Recipes.objects.select_for_update(no_key=not for_change)
+            .filter(pk__in=recipe_ids)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    @transaction.atomic
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        """
+        Добавление ингредиентов нескольких рецептов в список покупок
+        пользователя (количество одинаковых ингредиентов суммируется
+        запросом для каждых BATCH_MAX_SIZE рецептов). Рецепты блокируются
+        до конца транзакции (см. lock_recipes).
+        """
+        recipe_ids = sorted(recipe_ids)
+        self.lock_recipes(recipe_ids)
+        amounts = {}
+        for start in range(0, len(recipe_ids), settings.BATCH_MAX_SIZE):
+            rows = (
+                IngredientsInRecipe.objects.filter(
+                    recipe_id__in=recipe_ids[
+                        start:start + settings.BATCH_MAX_SIZE
+                    ]
+                )
+                .values_list("ingredient_id")
+                .order_by("ingredient_id")
+                .annotate(total=Sum("amount"))
+            )
+            for ingredient_id, amount in rows:
+                key = (user_id, ingredient_id)
+                amounts[key] = amounts.get(key, 0) + sign * amount
+        return self.apply(amounts)
+
+    def change_recipe(self, recipe_id, old_amounts, new_amounts):
+        """
+        Изменение списков покупок всех пользователей, добавивших рецепт
+        в корзину, при изменении ингредиентов рецепта. 'old_amounts' и
+        'new_amounts' - словари {идентификатор ингредиента: количество}.
+        Рецепт должен быть заблокирован до чтения 'old_amounts'
+        (lock_recipes с параметром 'for_change').
+        Возвращает идентификаторы пользователей, списки которых изменились.
+        """
+        changes = {
+            ingredient_id: new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        user_ids = ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list("user_id", flat=True)
+        return self.apply(
+            {
+                (user_id, ingredient_id): amount
+                for user_id in user_ids
+                for ingredient_id, amount in changes.items()
+            }
+        )
+
+    def expected(self):
+        """
+        Списки покупок, вычисленные по корзинам пользователей и составу
+        рецептов: (пользователь, ингредиент, суммарное количество).
+        """
+        return (
+            IngredientsInRecipe.objects.filter(
+                recipe__shopping_list__isnull=False
+            )
+            .values_list("recipe__shopping_list__user", "ingredient")
+            .order_by("recipe__shopping_list__user", "ingredient")
+            .annotate(total=Sum("amount"))
+        )
+
+    @transaction.atomic
+    def rebuild(self):
+        """Полное перестроение списков покупок всех пользователей."""
+        self.all().delete()
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=amount
+                )
+                for user_id, ingredient_id, amount in self.expected()
+            ),
+            batch_size=1000,
+        )
+
+
+class IngredientsInShoppingList(models.Model):
+    """
+    Модель списка покупок пользователя: суммарное количество каждого
+    ингредиента рецептов в корзине. Записи изменяются при добавлении и
+    удалении рецептов из корзины и при изменении ингредиентов рецептов,
+    находящихся в корзине (перестроение и проверка - команда shoppinglists).
+    """
+
+    user = models.ForeignKey(
+        CustomUser, verbose_name="Пользователь", on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredients, verbose_name="Ингредиент", on_delete=models.CASCADE
+    )
+    amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    objects = IngredientsInShoppingListQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user} - {self.ingredient} {self.amount}"
+
+    class Meta:
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Ингредиенты в списке покупок"
+        default_related_name = "shopping_list_ingredients"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_ingredient",
+            )
+        ]
+
+
+class RecipesInFeedQuerySet(models.QuerySet):
+    @staticmethod
+    def is_pulled(author_id):
+        """
+        Рецепты авторов с числом подписчиков больше FEED_FANOUT_MAX_FOLLOWERS
+        не записываются в ленты подписчиков, а выбираются при чтении ленты.
+        """
+        return CustomUser.objects.filter(
+            pk=author_id,
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).exists()
+
+    def fan_out(self, recipe):
+        """Запись нового рецепта в ленты подписчиков автора."""
+        if self.is_pulled(recipe.author_id):
+            return
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id
+        ).values_list("user_id", flat=True)
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, recipe=recipe, author_id=recipe.author_id
+                )
+                for user_id in followers.iterator()
+            ),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def backfill(self, user_id, author_ids):
+        """
+        Запись последних FEED_BACKFILL_SIZE рецептов каждого из авторов
+        'author_ids' в ленту пользователя при подписке (один запрос с оконной
+        функцией ROW_NUMBER). Выполняется и для авторов с большим числом
+        подписчиков, чтобы их прежние рецепты остались в ленте, если число
+        подписчиков станет меньше порога.
+        """
+        recipes = (
+            Recipes.objects.filter(author_id__in=author_ids)
+            .annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=F("author_id"),
+                    order_by=Recipes._meta.ordering,
+                )
+            )
+            .filter(position__lte=settings.FEED_BACKFILL_SIZE)
+            .values_list("id", "author_id")
+        )
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id
+                )
+                for recipe_id, author_id in recipes
+            ),
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def page_recipe_ids(self, user, position, descending, count):
+        """
+        Идентификаторы рецептов страницы ленты пользователя (не больше
+        'count') после позиции курсора 'position' в порядке убывания (или
+        возрастания) идентификаторов: объединение (UNION) подзапросов
+        с ограничением количества - рецептов из ленты пользователя (по
+        уникальному индексу (user, recipe)) и рецептов каждого из авторов
+        с большим числом подписчиков (по индексу (author, id)) - также
+        с ограничением количества.
+        """
+        lookup = "lt" if descending else "gt"
+        sign = "-" if descending else ""
+        bounds = {} if position is None else {f"id__{lookup}": position}
+        timeline = self.filter(
+            user=user,
+            **{f"recipe_{name}": value for name, value in bounds.items()},
+        ).order_by(f"{sign}recipe_id")
+        pulled_authors = Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("author_id", flat=True)
+        pulled = [
+            Recipes.objects.filter(author_id=author_id, **bounds).order_by(
+                f"{sign}id"
+            )[:count]
+            for author_id in pulled_authors
+        ]
+        if not pulled:
+            return timeline.values_list("recipe_id")[:count]
+        return (
+            self.limited(timeline[:count], "recipe_id")
+            .union(*(self.limited(recipes, "id") for recipes in pulled))
+            .order_by(f"{sign}recipe_id")[:count]
+        )
+
+    @staticmethod
+    def limited(queryset, field):
+        """
+        Подзапрос значений поля 'field' для части объединения. СУБД, которые
+        не допускают LIMIT в частях объединения (SQLite), получают его во
+        вложенном подзапросе.
+        """
+        features = connections[queryset.db].features
+        if features.supports_slicing_ordering_in_compound:
+            return queryset.values_list(field)
+        return (
+            queryset.model.objects.filter(pk__in=queryset.values("pk"))
+            .order_by()
+            .values_list(field)
+        )
+
+    def prune(self, user_id, author_ids):
+        """Удаление рецептов авторов из ленты пользователя при отписке."""
+        self.filter(user_id=user_id, author_id__in=author_ids).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        """Полное перестроение лент всех пользователей по подпискам."""
+        self.all().delete()
+        follows = Follow.objects.values_list("user_id", "author_id")
+        for user_id, author_id in follows.iterator():
+            self.backfill(user_id, (author_id,))
+
+
+class RecipesInFeed(models.Model):
+    """
+    Модель ленты рецептов пользователя (fan-out on write): рецепт
+    записывается в ленты подписчиков автора при создании, последние рецепты
+    автора - в ленту пользователя при подписке. Новые рецепты авторов
+    с большим числом подписчиков в ленты не записываются (см. 'is_pulled').
+    """
+
+    user = models.ForeignKey(
+        CustomUser, verbose_name="Пользователь", on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipes, verbose_name="Рецепт", on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        verbose_name="Автор рецепта",
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+
+    objects = RecipesInFeedQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user} - {self.recipe}"
+
+    class Meta:
+        verbose_name = "Рецепт в ленте"
+        verbose_name_plural = "Рецепты в ленте"
+        default_related_name = "feed_recipes"
+        indexes = [
+            models.Index(
+                fields=["user", "author"], name="feed_user_author_index"
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_feed_recipe"
+            )
+        ]
@@ -13,6 +13,8 @@ class CustomUserAdmin(UserAdmin):
         "email",
         "first_name",
         "last_name",
+        "recipes_count",
+        "followers_count",
     )
     search_fields = ("username", "email")
 
@@ -1,6 +1,6 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models
 
 from .validators import (
     username_name_list_validator,
@@ -64,6 +64,12 @@ class CustomUser(AbstractUser):
         ),
         max_length=settings.DEFAULT_MAX_LENGTH,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Количество подписчиков", default=0, editable=False
+    )
 
     def __str__(self):
         return self.username
@@ -74,6 +80,69 @@ class CustomUser(AbstractUser):
         verbose_name_plural = "Пользователи"
 
 
+class ReturningQuerySet(models.QuerySet):
+    """
+    Набор запросов модели с выполнением SQL запросов, возвращающих
+    идентификаторы (INSERT / DELETE ... RETURNING). Текст запроса - шаблон
+    с именами таблиц и столбцов из sql_names(), списком столбцов {columns}
+    и заполнителями {ids} списка идентификаторов.
+    """
+
+    def sql_names(self):
+        """Имена таблиц и столбцов для подстановки в текст запроса."""
+        return {"table": self.model._meta.db_table}
+
+    def format_sql(self, sql, columns=(), ids=1, **names):
+        """
+        Подстановка имен sql_names() и 'names', столбцов 'columns' и 'ids'
+        параметров списка идентификаторов в текст запроса.
+        """
+        quote = connections[self.db].ops.quote_name
+        names = {**self.sql_names(), **names}
+        return sql.format(
+            columns=", ".join(quote(field.column) for field in columns),
+            ids=", ".join(["%s"] * ids),
+            **{name: quote(value) for name, value in names.items()},
+        )
+
+    def execute(self, sql, params, ids=1, **names):
+        """Выполнение запроса, возвращающего идентификаторы."""
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(self.format_sql(sql, ids=ids, **names), params)
+            return {row[0] for row in cursor.fetchall()}
+
+
+class FollowQuerySet(ReturningQuerySet):
+    ADD_SQL = (
+        "INSERT INTO {table} ({user}, {author}) "
+        "SELECT %s, {pk} FROM {users} WHERE {pk} IN ({ids}) AND {pk} <> %s "
+        "ON CONFLICT DO NOTHING RETURNING {author}"
+    )
+
+    def sql_names(self):
+        opts = self.model._meta
+        return {
+            **super().sql_names(),
+            "user": opts.get_field("user").column,
+            "author": opts.get_field("author").column,
+            "users": CustomUser._meta.db_table,
+            "pk": CustomUser._meta.pk.column,
+        }
+
+    def add_many(self, user_id, author_ids):
+        """
+        Добавление подписок пользователя на авторов одним запросом INSERT
+        ... ON CONFLICT DO NOTHING RETURNING. Несуществующие авторы, сам
+        пользователь и авторы, на которых он уже подписан, пропускаются.
+        Возвращает идентификаторы авторов добавленных подписок.
+        """
+        if not author_ids:
+            return set()
+        return self.execute(
+            self.ADD_SQL, [user_id, *author_ids, user_id], ids=len(author_ids)
+        )
+
+
 class Follow(models.Model):
     """
     Модель подписок на других пользователей (авторов).
@@ -95,6 +164,8 @@ class Follow(models.Model):
         verbose_name="Подписан на автора",
     )
 
+    objects = FollowQuerySet.as_manager()
+
     class Meta:
         ordering = ("-id",)
         verbose_name = "Подписка на автора"